@@ -0,0 +1,148 @@
+"""
+Benchmark de throughput por número de workers.
+
+Para cada serviço e cada valor de --workers, recria o container com
+<SERVIÇO>_WORKERS=n (docker compose), espera o /readyz e gera carga de
+leitura por --duration segundos com conexões keep-alive, em vários
+processos para o gerador não ser o gargalo. Imprime req/s, p50/p99 e o
+ganho em relação à primeira configuração; com --markdown imprime no fim a
+mesma tabela em markdown, para colar no README (seção 4.13).
+
+Só faz sentido numa máquina com mais núcleos que o maior --workers: os
+workers e o gerador de carga disputam a mesma CPU.
+
+Uso (na pasta Projeto-BD, com o compose no ar e dados carregados):
+  python scripts/bench_workers.py --workers 1 2 4 --duration 15
+  python scripts/bench_workers.py --service movies --workers 1 4 --seed 200
+  python scripts/bench_workers.py --workers 1 2 4 --markdown
+"""
+import argparse, http.client, json, multiprocessing, os, subprocess, threading, time, urllib.request
+
+# serviço -> (container no compose, variável de workers, porta no host, rota de leitura)
+SERVICES = {
+    "users": ("users-service", "USERS_WORKERS", 8001, "/users?limit=20"),
+    "movies": ("movies-service", "MOVIES_WORKERS", 8002, "/movies/?limit=20"),
+    "ratings": ("ratings-service", "RATINGS_WORKERS", 8003, "/ratings/top?limit=10"),
+    "s1": ("s1-manager", "S1_WORKERS", 8000, "/logs?limit=20"),
+}
+
+
+def recreate(container: str, env_var: str, workers: int):
+    env = {**os.environ, env_var: str(workers)}
+    subprocess.run(
+        ["docker", "compose", "up", "-d", "--no-deps", "--force-recreate", container],
+        env=env, check=True, stdout=subprocess.DEVNULL,
+    )
+
+
+def wait_ready(port: int, timeout: float = 180):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://localhost:{port}/readyz", timeout=2) as resp:
+                body = json.load(resp)
+                return body["workers"]["ready"]
+        except Exception:
+            time.sleep(1)
+    raise TimeoutError(f"porta {port} não ficou pronta em {timeout}s")
+
+
+def load_process(port: int, path: str, threads: int, duration: float) -> tuple[list[float], int]:
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def loop():
+        conn = http.client.HTTPConnection("localhost", port, timeout=10)
+        mine, failed = [], 0
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                conn.request("GET", path)
+                resp = conn.getresponse()
+                resp.read()
+                if resp.status >= 500:
+                    failed += 1
+                else:
+                    mine.append(time.perf_counter() - started)
+            except Exception:
+                failed += 1
+                conn.close()
+                conn = http.client.HTTPConnection("localhost", port, timeout=10)
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    workers = [threading.Thread(target=loop) for _ in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return latencies, errors[0]
+
+
+def run_load(port: int, path: str, concurrency: int, procs: int, duration: float) -> dict:
+    threads = max(1, concurrency // procs)
+    with multiprocessing.Pool(procs) as pool:
+        results = pool.starmap(load_process, [(port, path, threads, duration)] * procs)
+    latencies = sorted(l for lat, _ in results for l in lat)
+    errors = sum(e for _, e in results)
+    pct = lambda p: latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000 if latencies else 0.0
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / duration,
+        "p50_ms": pct(0.5),
+        "p99_ms": pct(0.99),
+        "errors": errors,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput por número de workers")
+    parser.add_argument("--service", choices=[*SERVICES, "all"], default="all")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--warmup", type=float, default=3, help="segundos de carga descartados antes de medir")
+    parser.add_argument("--concurrency", type=int, default=64, help="conexões simultâneas no total")
+    parser.add_argument("--procs", type=int, default=os.cpu_count() or 2, help="processos do gerador de carga")
+    parser.add_argument("--seed", type=int, default=0, help="gera N usuários/filmes/ratings via s1-manager antes")
+    parser.add_argument("--markdown", action="store_true", help="imprime no fim a tabela em markdown")
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    print(f"host: {cpus} CPUs")
+    if cpus <= max(args.workers):
+        print(f"aviso: {cpus} CPUs para até {max(args.workers)} workers + gerador, o ganho medido não é o do serviço")
+
+    if args.seed:
+        n = args.seed
+        urllib.request.urlopen(urllib.request.Request(
+            f"http://localhost:8000/run?users={n}&movies={n}&ratings={n * 5}&reviews={n}", method="POST",
+        ), timeout=600).read()
+
+    rows = []
+    names = list(SERVICES) if args.service == "all" else [args.service]
+    for name in names:
+        container, env_var, port, path = SERVICES[name]
+        print(f"\n{container} GET {path}")
+        print(f"{'workers':>7} {'req/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'erros':>6} {'ganho':>6}")
+        base = None
+        for workers in args.workers:
+            recreate(container, env_var, workers)
+            ready = wait_ready(port)
+            run_load(port, path, args.concurrency, args.procs, args.warmup)
+            r = run_load(port, path, args.concurrency, args.procs, args.duration)
+            base = base or r["rps"]
+            print(f"{ready:>7} {r['rps']:>10.1f} {r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['errors']:>6} "
+                  f"{r['rps'] / base if base else 0:>5.2f}x")
+            rows.append((container, path, ready, r, r["rps"] / base if base else 0))
+        # volta ao padrão do compose
+        recreate(container, env_var, int(os.getenv(env_var, "1")))
+
+    if args.markdown:
+        print(f"\n{cpus} CPUs, {args.concurrency} conexões, {args.duration:g}s por configuração\n")
+        print("| serviço | rota | workers | req/s | p50 ms | p99 ms | erros | ganho |")
+        print("|---|---|---:|---:|---:|---:|---:|---:|")
+        for container, path, ready, r, gain in rows:
+            print(f"| {container} | `{path}` | {ready} | {r['rps']:.1f} | {r['p50_ms']:.1f} | {r['p99_ms']:.1f} "
+                  f"| {r['errors']} | {gain:.2f}x |")
@@ -0,0 +1,7 @@
+"""
+Módulos compartilhados pelos quatro serviços: profiling, probes de saúde,
+estado entre workers e configuração do gunicorn.
+
+Cada Dockerfile copia esta pasta para /app/common (o contexto de build do
+compose é a pasta services/), ao lado do pacote application do serviço.
+"""
@@ -0,0 +1,29 @@
+"""
+ETags e requests condicionais (If-None-Match).
+
+Os ETags são fracos (W/"..."): a resposta pode sair comprimida ou não
+(GZipMiddleware) e continua sendo a mesma representação. If-None-Match usa
+comparação fraca, como manda a RFC 9110: W/"x" e "x" casam.
+"""
+import hashlib
+from fastapi import Request, Response
+
+def make_etag(*parts) -> str:
+    raw = ":".join(str(p) for p in parts)
+    return 'W/"' + hashlib.sha1(raw.encode()).hexdigest()[:20] + '"'
+
+def opaque_tag(etag: str) -> str:
+    # W/"abc" ou "abc" -> abc
+    return etag.strip().removeprefix("W/").strip('"')
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    if "*" in tags:
+        return True
+    return opaque_tag(etag) in {opaque_tag(t) for t in tags if t}
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
@@ -0,0 +1,42 @@
+"""
+Worker uvicorn para o gunicorn que drena antes de parar.
+
+O uvicorn fecha o socket assim que recebe o SIGTERM e só depois roda o
+shutdown da aplicação, então um /readyz em 503 "durante o drain" nunca seria
+visto. Aqui o primeiro SIGTERM só marca o worker como drenando (/readyz
+responde 503, ver health.py) e o servidor continua aceitando requests por
+DRAIN_DELAY segundos, tempo para o balanceador/orquestrador tirar o
+container da rota; depois segue o shutdown normal do uvicorn, que espera as
+requests em andamento. Um segundo sinal (ou DRAIN_DELAY=0) para na hora.
+
+DRAIN_DELAY + o tempo das requests precisa caber no GRACEFUL_TIMEOUT do
+gunicorn e no stop_grace_period do compose.
+"""
+import os, signal, sys, threading
+from gunicorn.arbiter import Arbiter
+from uvicorn.server import Server
+from uvicorn.workers import UvicornWorker
+from . import health
+
+DRAIN_DELAY = float(os.getenv("DRAIN_DELAY", "5"))
+
+
+class DrainingServer(Server):
+    def handle_exit(self, sig, frame):
+        if sig != signal.SIGTERM or DRAIN_DELAY <= 0 or health.draining:
+            return super().handle_exit(sig, frame)
+        health.start_draining()
+        timer = threading.Timer(DRAIN_DELAY, Server.handle_exit, (self, sig, frame))
+        timer.daemon = True
+        timer.start()
+
+
+class DrainingWorker(UvicornWorker):
+    async def _serve(self):
+        # mesmo que UvicornWorker._serve, trocando o Server
+        self.config.app = self.wsgi
+        server = DrainingServer(config=self.config)
+        self._install_sigquit_handler()
+        await server.serve(sockets=self.sockets)
+        if not server.started:
+            sys.exit(Arbiter.WORKER_BOOT_ERROR)
@@ -0,0 +1,29 @@
+"""
+Configuração do gunicorn com workers uvicorn.
+
+  WEB_CONCURRENCY     número de workers (padrão 1)
+  GUNICORN_PRELOAD    1 = importa a aplicação no master antes do fork
+  GRACEFUL_TIMEOUT    segundos para as requests em andamento terminarem num
+                      restart/stop antes de o worker ser encerrado
+  DRAIN_DELAY         segundos com /readyz em 503 antes de o worker parar de
+                      aceitar conexões (ver draining_worker.py)
+  GUNICORN_MAX_REQUESTS  recicla o worker depois de N requests (0 = nunca)
+
+Uso: gunicorn -c common/gunicorn_conf.py application.main:api
+"""
+import os, shutil
+
+bind = "0.0.0.0:8000"
+worker_class = "common.draining_worker.DrainingWorker"
+workers = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+preload_app = os.getenv("GUNICORN_PRELOAD", "0") == "1"
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+
+
+def on_starting(server):
+    # Estado publicado pelos workers de uma execução anterior (ver workers.py)
+    shutil.rmtree(os.getenv("WORKER_STATE_DIR", "/tmp/worker-state"), ignore_errors=True)
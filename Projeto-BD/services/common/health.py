@@ -0,0 +1,169 @@
+"""
+Aquecimento em segundo plano e probes de saúde.
+
+Os passos lentos da subida (índices, migrações, backfills) e o aquecimento
+de pools/caches rodam numa thread, sem segurar o servidor:
+
+  GET /healthz   200 enquanto o processo responde (liveness)
+  GET /readyz    503 até todos os passos obrigatórios terminarem, 200 depois
+
+As duas rotas devolvem o andamento de cada passo (estado, progresso, erro).
+Passo obrigatório que falha (ex.: banco ainda subindo) é repetido com
+backoff; passo opcional falha uma vez e segue.
+
+Com vários workers (ver workers.py) cada um aquece os próprios pools; passos
+`once` (índices, migrações) rodam sob um lock e deixam uma marca em
+WORKER_STATE_DIR, então só o primeiro faz o trabalho e os outros pulam o
+passo (estado "skipped"). Na subida o container só fica pronto quando todos
+os workers estão prontos. No SIGTERM o worker passa a responder 503 no
+/readyz e continua atendendo por DRAIN_DELAY segundos antes de parar de
+aceitar conexões (ver draining_worker.py).
+"""
+import asyncio, inspect, os, threading, time
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from .workers import WORKERS, collect, exclusive, is_done, mark_done, publish
+
+WARMUP_RETRY_MAX = float(os.getenv("WARMUP_RETRY_MAX", "30"))
+
+
+class Step:
+    """Passo do aquecimento. Se `fn` aceitar `progress`, recebe step.progress(done, total)."""
+    def __init__(self, name: str, fn, required: bool = True, once: bool = False):
+        self.name = name
+        self.fn = fn
+        self.required = required
+        self.once = once
+        self.state = "pending"
+        self.done = 0
+        self.total = None
+        self.attempts = 0
+        self.error = None
+        self.seconds = None
+
+    def progress(self, done: int, total: int | None = None):
+        self.done = done
+        if total is not None:
+            self.total = total
+
+    def summary(self) -> dict:
+        return {
+            "name": self.name,
+            "required": self.required,
+            "state": self.state,
+            "progress": f"{self.done}/{self.total}" if self.total is not None else None,
+            "attempts": self.attempts,
+            "seconds": round(self.seconds, 2) if self.seconds is not None else None,
+            "error": self.error,
+        }
+
+
+steps: list[Step] = []
+started_at = time.monotonic()
+ready_at = None
+draining = False
+all_workers_ready = False
+
+
+def ready_workers() -> int:
+    if WORKERS == 1:
+        return int(ready_at is not None and not draining)
+    return sum(1 for state in collect("health").values() if state.get("ready"))
+
+
+def is_ready() -> bool:
+    global all_workers_ready
+    if ready_at is None or draining:
+        return False
+    # Na subida espera todos os workers; depois, um worker reciclado
+    # (GUNICORN_MAX_REQUESTS) aquecendo não tira o container do ar
+    if not all_workers_ready:
+        all_workers_ready = ready_workers() >= WORKERS
+    return all_workers_ready
+
+
+def call_step(step: Step, loop: asyncio.AbstractEventLoop) -> bool:
+    """Roda o passo; False se era `once` e outro worker já o concluiu."""
+    kwargs = {"progress": step.progress} if "progress" in inspect.signature(step.fn).parameters else {}
+    if inspect.iscoroutinefunction(step.fn):
+        # clientes async (httpx) pertencem ao loop do servidor
+        run = lambda: asyncio.run_coroutine_threadsafe(step.fn(**kwargs), loop).result()
+    else:
+        run = lambda: step.fn(**kwargs)
+    if not step.once:
+        run()
+        return True
+    with exclusive(step.name):
+        if is_done(step.name):
+            return False
+        run()
+        mark_done(step.name)
+    return True
+
+
+def run_warmup(loop: asyncio.AbstractEventLoop):
+    global ready_at
+    for step in steps:
+        step.state = "running"
+        started = time.monotonic()
+        delay = 0.5
+        while True:
+            step.attempts += 1
+            try:
+                step.state = "done" if call_step(step, loop) else "skipped"
+                step.error = None
+                break
+            except Exception as err:
+                step.error = f"{type(err).__name__}: {err}"
+                print(f"warmup: passo {step.name} falhou (tentativa {step.attempts}):", step.error)
+                if not step.required:
+                    step.state = "failed"
+                    break
+                time.sleep(delay)
+                delay = min(delay * 2, WARMUP_RETRY_MAX)
+        step.seconds = time.monotonic() - started
+    ready_at = time.monotonic()
+    publish("health", {"ready": True})
+    print(f"warmup: pronto em {ready_at - started_at:.1f}s")
+
+
+def start_draining():
+    global draining
+    draining = True
+    publish("health", {"ready": False})
+
+
+def status() -> dict:
+    return {
+        "ready": is_ready(),
+        "uptime_s": round(time.monotonic() - started_at, 1),
+        "warmup_s": round(ready_at - started_at, 1) if ready_at is not None else None,
+        "draining": draining,
+        "workers": {"expected": WORKERS, "ready": ready_workers()},
+        "steps": [s.summary() for s in steps],
+    }
+
+
+health_router = APIRouter(tags=["health"])
+
+@health_router.get("/healthz")
+def healthz():
+    return status()
+
+@health_router.get("/readyz")
+def readyz():
+    return JSONResponse(status_code=200 if is_ready() else 503, content=status())
+
+
+def install_health(app, *warmup_steps: Step):
+    steps.extend(warmup_steps)
+    app.include_router(health_router)
+
+    @app.on_event("startup")
+    async def start_warmup():
+        loop = asyncio.get_running_loop()
+        threading.Thread(target=run_warmup, args=(loop,), name="warmup", daemon=True).start()
+
+    # Com gunicorn o draining começa no SIGTERM (draining_worker.py); aqui
+    # cobre o uvicorn rodando direto
+    app.add_event_handler("shutdown", start_draining)
@@ -0,0 +1,403 @@
+"""
+Profiling sob demanda (opt-in).
+
+Com PROFILING_ENABLED=1, uma request com o header `X-Profile: cprofile` (ou
+`X-Profile: sample`) é perfilada e a resposta traz `X-Profile-Id` e
+`Server-Timing` com o tempo gasto em banco, serialização e HTTP de saída.
+`PUT /debug/profiling?sample_rate=0.01` perfila uma fração das requests sem
+precisar do header. Os resultados ficam em WORKER_STATE_DIR/profiles (os
+PROFILE_KEEP mais recentes do container, de qualquer worker) e podem ser
+baixados por qualquer worker:
+
+  GET /debug/profiles                    lista os últimos perfis
+  GET /debug/profiles/{id}/pstats        arquivo pstats (modo cprofile)
+  GET /debug/profiles/{id}/collapsed     pilhas colapsadas p/ flamegraph (modo sample)
+
+As rotas /debug só são montadas com PROFILING_TOKEN definido e exigem o
+header `X-Profile-Token` com o mesmo valor; com o token definido, o header
+X-Profile também só é aceito junto com ele.
+
+A taxa de amostragem também vale para todos os workers: o PUT grava em
+WORKER_STATE_DIR e cada worker relê o arquivo no máximo uma vez por segundo.
+
+Só um perfil cProfile roda por vez no processo (o profiler é global no
+intérprete e dois ligados ao mesmo tempo na mesma thread se atrapalham); uma
+request que chega com outro em andamento não é perfilada e o perfil dela
+registra o motivo em `note`.
+
+Com PROFILING_ENABLED desligado nada aqui é instalado: sem middleware, sem
+rotas extras e sem hooks em banco/HTTP.
+"""
+import cProfile, contextvars, functools, hmac, inspect, json, marshal, os, random, re, sys, threading, time, uuid
+from collections import Counter
+from contextlib import contextmanager
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse, Response
+from fastapi.routing import APIRoute
+from .workers import STATE_DIR
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+
+CATEGORIES = ("db", "serialization", "http")
+
+PROFILE_DIR = os.path.join(STATE_DIR, "profiles")
+SETTINGS_PATH = os.path.join(STATE_DIR, "profiling.json")
+
+current = contextvars.ContextVar("current_profile", default=None)
+settings = {"sample_rate": 0.0}
+settings_checked = [0.0]
+cprofile_lock = threading.Lock()
+
+
+class ProfileSession:
+    def __init__(self, mode: str, method: str, path: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.mode = mode
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.total = None
+        self.times = dict.fromkeys(CATEGORIES, 0.0)
+        self.stats = None          # pstats (dict marshal-ável) no modo cprofile
+        self.stacks = Counter()    # pilha colapsada -> amostras no modo sample
+        self.note = None
+
+    def summary(self) -> dict:
+        total = self.total if self.total is not None else time.perf_counter() - self.started
+        return {
+            "id": self.id,
+            "mode": self.mode,
+            "method": self.method,
+            "path": self.path,
+            "total_ms": round(total * 1000, 2),
+            **{f"{c}_ms": round(t * 1000, 2) for c, t in self.times.items()},
+            "other_ms": round(max(total - sum(self.times.values()), 0) * 1000, 2),
+            "note": self.note,
+            "pid": os.getpid(),
+        }
+
+
+def add_time(category: str, seconds: float):
+    session = current.get()
+    if session is not None:
+        session.times[category] += seconds
+
+
+@contextmanager
+def timed(category: str):
+    session = current.get()
+    if session is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        session.times[category] += time.perf_counter() - started
+
+
+# ---------------------------------------------------------------- endpoints
+
+def sample_thread(session: ProfileSession, thread_id: int, stop: threading.Event):
+    while not stop.wait(SAMPLE_INTERVAL):
+        frame = sys._current_frames().get(thread_id)
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        if stack:
+            session.stacks[";".join(reversed(stack))] += 1
+
+
+@contextmanager
+def profile_call(session: ProfileSession):
+    # Roda na thread que executa o endpoint (threadpool para `def`, loop para `async def`)
+    if session.mode == "sample":
+        stop = threading.Event()
+        sampler = threading.Thread(
+            target=sample_thread, args=(session, threading.get_ident(), stop), daemon=True,
+        )
+        sampler.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            sampler.join()
+        return
+
+    if not cprofile_lock.acquire(blocking=False):
+        session.note = "not profiled: another cprofile session was running"
+        yield
+        return
+    try:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.create_stats()
+            session.stats = profiler.stats
+    finally:
+        cprofile_lock.release()
+
+
+def profiled(endpoint):
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            session = current.get()
+            if session is None:
+                return await endpoint(*args, **kwargs)
+            with profile_call(session):
+                return await endpoint(*args, **kwargs)
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            session = current.get()
+            if session is None:
+                return endpoint(*args, **kwargs)
+            with profile_call(session):
+                return endpoint(*args, **kwargs)
+    wrapper.profiled = True
+    return wrapper
+
+
+class ProfilingRoute(APIRoute):
+    """Rota que envolve o endpoint com o profiler quando PROFILING_ENABLED=1."""
+    def __init__(self, path, endpoint, **kwargs):
+        # include_router recria a rota com o endpoint já envolvido
+        if PROFILING_ENABLED and not getattr(endpoint, "profiled", False):
+            endpoint = profiled(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+
+# ----------------------------------------------------------------- storage
+
+def write_file(path: str, data: bytes):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    # rename atômico: outro worker nunca lê um arquivo pela metade
+    os.replace(tmp, path)
+
+
+def profile_path(profile_id: str, ext: str) -> str:
+    return os.path.join(PROFILE_DIR, f"{profile_id}.{ext}")
+
+
+def save_profile(session: ProfileSession):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    if session.stats is not None:
+        write_file(profile_path(session.id, "pstats"), marshal.dumps(session.stats))
+    if session.stacks:
+        collapsed = "\n".join(f"{stack} {n}" for stack, n in session.stacks.most_common())
+        write_file(profile_path(session.id, "collapsed"), collapsed.encode())
+    # o resumo por último: quem lista só vê perfis com os arquivos completos
+    write_file(profile_path(session.id, "json"), json.dumps(session.summary()).encode())
+    trim_profiles()
+
+
+def saved_profiles() -> list[str]:
+    """Ids dos perfis guardados, do mais recente para o mais antigo."""
+    try:
+        names = [name for name in os.listdir(PROFILE_DIR) if name.endswith(".json")]
+    except FileNotFoundError:
+        return []
+    ids = []
+    for name in names:
+        try:
+            ids.append((os.path.getmtime(os.path.join(PROFILE_DIR, name)), name.removesuffix(".json")))
+        except FileNotFoundError:
+            continue
+    return [profile_id for _, profile_id in sorted(ids, reverse=True)]
+
+
+def trim_profiles():
+    for profile_id in saved_profiles()[PROFILE_KEEP:]:
+        for ext in ("json", "pstats", "collapsed"):
+            try:
+                os.remove(profile_path(profile_id, ext))
+            except FileNotFoundError:
+                pass
+
+
+def load_settings():
+    now = time.monotonic()
+    if now - settings_checked[0] < 1:
+        return
+    settings_checked[0] = now
+    try:
+        with open(SETTINGS_PATH) as f:
+            settings.update(json.load(f))
+    except (FileNotFoundError, ValueError):
+        pass
+
+
+# --------------------------------------------------------------- middleware
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith("/debug/") or scope["path"] in ("/healthz", "/readyz"):
+            return await self.app(scope, receive, send)
+
+        mode = token = None
+        for name, value in scope["headers"]:
+            if name == b"x-profile":
+                mode = "sample" if value.decode().lower() == "sample" else "cprofile"
+            elif name == b"x-profile-token":
+                token = value.decode()
+        if mode is not None and PROFILING_TOKEN and not valid_token(token):
+            mode = None
+        if mode is None:
+            load_settings()
+        if mode is None and settings["sample_rate"] > 0 and random.random() < settings["sample_rate"]:
+            mode = "cprofile"
+        if mode is None:
+            return await self.app(scope, receive, send)
+
+        session = ProfileSession(mode, scope["method"], scope["path"])
+        context_token = current.set(session)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                session.total = time.perf_counter() - session.started
+                summary = session.summary()
+                timing = ", ".join(
+                    f"{name};dur={summary[f'{name}_ms']}" for name in (*CATEGORIES, "other", "total")
+                )
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-id", session.id.encode()))
+                headers.append((b"server-timing", timing.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current.reset(context_token)
+            save_profile(session)
+
+
+# ------------------------------------------------------------- debug routes
+
+def valid_token(token: str | None) -> bool:
+    return token is not None and hmac.compare_digest(token.encode(), PROFILING_TOKEN.encode())
+
+def require_token(x_profile_token: str | None = Header(None)):
+    if not valid_token(x_profile_token):
+        raise HTTPException(status_code=403, detail="invalid or missing X-Profile-Token")
+
+debug_router = APIRouter(prefix="/debug", tags=["debug"], dependencies=[Depends(require_token)])
+
+def read_profile(profile_id: str, ext: str) -> bytes | None:
+    # o id vem da URL: só aceita o formato gerado em ProfileSession
+    if not re.fullmatch(r"[0-9a-f]{12}", profile_id):
+        return None
+    try:
+        with open(profile_path(profile_id, ext), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def get_summary(profile_id: str) -> dict:
+    summary = read_profile(profile_id, "json")
+    if summary is None:
+        raise HTTPException(status_code=404, detail="profile not found")
+    return json.loads(summary)
+
+@debug_router.get("/profiles")
+def list_profiles():
+    result = []
+    for profile_id in saved_profiles():
+        summary = read_profile(profile_id, "json")
+        if summary is not None:
+            result.append(json.loads(summary))
+    return result
+
+@debug_router.get("/profiles/{profile_id}")
+def get_profile(profile_id: str, limit: int = 30):
+    result = get_summary(profile_id)
+    pstats = read_profile(profile_id, "pstats")
+    if pstats is not None:
+        # funções mais caras por tempo acumulado
+        stats = marshal.loads(pstats)
+        top = sorted(stats.items(), key=lambda kv: kv[1][3], reverse=True)[:limit]
+        result["top"] = [
+            {"function": f"{fn} ({os.path.basename(file)}:{line})", "calls": nc, "tottime_ms": round(tt * 1000, 3),
+             "cumtime_ms": round(ct * 1000, 3)}
+            for (file, line, fn), (cc, nc, tt, ct, _) in top
+        ]
+    return result
+
+@debug_router.get("/profiles/{profile_id}/pstats")
+def download_pstats(profile_id: str):
+    get_summary(profile_id)
+    pstats = read_profile(profile_id, "pstats")
+    if pstats is None:
+        raise HTTPException(status_code=404, detail="profile has no pstats (mode=sample)")
+    # mesmo formato de pstats.Stats.dump_stats: abrir com pstats.Stats(arquivo)
+    return Response(
+        content=pstats,
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="{profile_id}.pstats"'},
+    )
+
+@debug_router.get("/profiles/{profile_id}/collapsed", response_class=PlainTextResponse)
+def download_collapsed(profile_id: str):
+    get_summary(profile_id)
+    collapsed = read_profile(profile_id, "collapsed")
+    if collapsed is None:
+        raise HTTPException(status_code=404, detail="profile has no samples (mode=cprofile)")
+    # formato "f1;f2;f3 N" do flamegraph.pl / speedscope
+    return collapsed.decode()
+
+@debug_router.put("/profiling")
+def set_profiling(sample_rate: float = Query(..., ge=0, le=1)):
+    settings["sample_rate"] = sample_rate
+    os.makedirs(STATE_DIR, exist_ok=True)
+    write_file(SETTINGS_PATH, json.dumps(settings).encode())
+    return settings
+
+
+# ------------------------------------------------------------------- hooks
+
+def instrument_serialization():
+    # validação/encoding do retorno (serialize_response) e json.dumps (render)
+    import fastapi.routing
+    from starlette.responses import JSONResponse
+
+    serialize_response = fastapi.routing.serialize_response
+
+    @functools.wraps(serialize_response)
+    async def timed_serialize_response(*args, **kwargs):
+        with timed("serialization"):
+            return await serialize_response(*args, **kwargs)
+
+    render = JSONResponse.render
+
+    @functools.wraps(render)
+    def timed_render(self, content):
+        with timed("serialization"):
+            return render(self, content)
+
+    fastapi.routing.serialize_response = timed_serialize_response
+    JSONResponse.render = timed_render
+
+
+def install_profiling(app):
+    if not PROFILING_ENABLED:
+        return
+    instrument_serialization()
+    app.add_middleware(ProfilingMiddleware)
+    if PROFILING_TOKEN:
+        app.include_router(debug_router)
+    else:
+        print("profiling: PROFILING_TOKEN vazio, rotas /debug não instaladas")
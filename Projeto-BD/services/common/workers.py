@@ -0,0 +1,91 @@
+"""
+Modo multi-processo: gunicorn com workers uvicorn (ver gunicorn_conf.py).
+
+WEB_CONCURRENCY é o número de workers do container. Os tamanhos de pool
+configurados por variável de ambiente são o total do container e cada worker
+fica com a sua parte (per_worker), para N workers não abrirem N vezes mais
+conexões no banco.
+
+Estado em memória que precisa ser visto como um todo (estatísticas,
+prontidão) é publicado por cada worker em WORKER_STATE_DIR, um arquivo por
+pid; qualquer worker lê os arquivos dos outros para responder o agregado.
+"""
+import fcntl, json, os, time
+from contextlib import contextmanager
+
+WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+STATE_DIR = os.getenv("WORKER_STATE_DIR", "/tmp/worker-state")
+
+
+def per_worker(total: int, minimum: int = 1) -> int:
+    return max(minimum, total // WORKERS)
+
+
+def publish(name: str, data: dict):
+    os.makedirs(STATE_DIR, exist_ok=True)
+    path = os.path.join(STATE_DIR, f"{name}.{os.getpid()}.json")
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"ts": time.time(), "data": data}, f)
+    # rename atômico: quem lê nunca vê um arquivo pela metade
+    os.replace(tmp, path)
+
+
+def alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def collect(name: str) -> dict[int, dict]:
+    """Último estado publicado por cada worker vivo, por pid."""
+    result = {}
+    try:
+        files = os.listdir(STATE_DIR)
+    except FileNotFoundError:
+        return result
+
+    for filename in files:
+        prefix, _, pid = filename.removesuffix(".json").rpartition(".")
+        if prefix != name or not filename.endswith(".json") or not pid.isdigit():
+            continue
+        path = os.path.join(STATE_DIR, filename)
+        if not alive(int(pid)):
+            # worker que morreu ou foi reciclado
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            continue
+        try:
+            with open(path) as f:
+                result[int(pid)] = json.load(f)["data"]
+        except (FileNotFoundError, ValueError):
+            continue
+    return result
+
+
+def mark_done(name: str):
+    os.makedirs(STATE_DIR, exist_ok=True)
+    open(os.path.join(STATE_DIR, f"{name}.done"), "w").close()
+
+
+def is_done(name: str) -> bool:
+    """Se algum worker já concluiu `name` nesta execução (o master limpa STATE_DIR na subida)."""
+    return os.path.exists(os.path.join(STATE_DIR, f"{name}.done"))
+
+
+@contextmanager
+def exclusive(name: str):
+    """Lock entre os workers do container, ex.: construir índices uma vez só."""
+    os.makedirs(STATE_DIR, exist_ok=True)
+    with open(os.path.join(STATE_DIR, f"{name}.lock"), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
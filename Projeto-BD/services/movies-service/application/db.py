@@ -1,19 +1,78 @@
-from pymongo import MongoClient, ASCENDING, TEXT, DESCENDING
-import os
-
-MONGO_URL = os.getenv("MONGO_URL", "mongodb://mongo:27017")
-MONGO_DB = os.getenv("MONGO_DB", "polyglot_movies")
-
-client = MongoClient(MONGO_URL)
-db = client[MONGO_DB]
-
-movies = db["movies"]
-reviews = db["reviews"]
-
-def ensure_indexes():
-    movies.create_index([("title", TEXT)])
-    movies.create_index([("genres", ASCENDING)])
-    movies.create_index([("year", ASCENDING)])
-    reviews.create_index([("movie_id", ASCENDING), ("created_at", DESCENDING)])
-    reviews.create_index([("user_id", ASCENDING), ("created_at", DESCENDING)])
-    reviews.create_index([("text", TEXT)])
+from pymongo import MongoClient, ASCENDING, TEXT, DESCENDING, ReturnDocument, monitoring
+from concurrent.futures import ThreadPoolExecutor
+import os
+from common.profiling import PROFILING_ENABLED, add_time
+from common.workers import per_worker
+
+MONGO_URL = os.getenv("MONGO_URL", "mongodb://mongo:27017")
+MONGO_DB = os.getenv("MONGO_DB", "polyglot_movies")
+# Totais do container, divididos entre os workers (ver workers.py). O mínimo
+# são conexões mantidas abertas mesmo ociosas (ver warm_pool)
+MONGO_MAX_POOL_SIZE = per_worker(int(os.getenv("MONGO_MAX_POOL_SIZE", "100")))
+MONGO_MIN_POOL_SIZE = per_worker(int(os.getenv("MONGO_MIN_POOL_SIZE", "10")))
+
+class CommandTimer(monitoring.CommandListener):
+    # Soma a duração de cada comando Mongo no perfil da request (só com profiling ligado)
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        add_time("db", event.duration_micros / 1e6)
+
+    def failed(self, event):
+        add_time("db", event.duration_micros / 1e6)
+
+client = MongoClient(
+    MONGO_URL,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    event_listeners=[CommandTimer()] if PROFILING_ENABLED else [],
+)
+db = client[MONGO_DB]
+
+movies = db["movies"]
+reviews = db["reviews"]
+# Resumo materializado por gênero/ano/década (ver movies/facets.py)
+movie_facets = db["movie_facets"]
+# Contadores de versão por coleção (ex.: {"_id": "movies", "version": 42})
+meta = db["meta"]
+
+# (coleção, chaves); create_index é no-op quando o índice já existe
+INDEXES = [
+    (movies, [("title", TEXT)]),
+    (movies, [("genres", ASCENDING)]),
+    (movies, [("year", ASCENDING)]),
+    # autocomplete: regex ^prefixo sobre o array multikey usa o índice
+    (movies, [("title_suffixes", ASCENDING)]),
+    # filtro/ordenação por rating (resumo embutido pelo ratings-service)
+    (movies, [("rating_avg", DESCENDING), ("rating_count", DESCENDING)]),
+    (movie_facets, [("genre", ASCENDING), ("dim", ASCENDING), ("value", ASCENDING)]),
+    (reviews, [("movie_id", ASCENDING), ("created_at", DESCENDING)]),
+    (reviews, [("user_id", ASCENDING), ("created_at", DESCENDING)]),
+    (reviews, [("text", TEXT)]),
+]
+
+def ensure_indexes(progress=lambda done, total: None):
+    # Roda no aquecimento em segundo plano (ver health.py): o servidor já
+    # responde /healthz enquanto os índices são construídos
+    for i, (collection, keys) in enumerate(INDEXES):
+        progress(i, len(INDEXES))
+        collection.create_index(keys)
+    progress(len(INDEXES), len(INDEXES))
+
+def warm_pool():
+    # Abre as MONGO_MIN_POOL_SIZE conexões do worker de uma vez, em vez de na primeira rajada de requests
+    client.admin.command("ping")
+    with ThreadPoolExecutor(max_workers=MONGO_MIN_POOL_SIZE) as pool:
+        list(pool.map(lambda _: client.admin.command("ping"), range(MONGO_MIN_POOL_SIZE)))
+
+def bump_version(name: str) -> int:
+    doc = meta.find_one_and_update(
+        {"_id": name}, {"$inc": {"version": 1}},
+        upsert=True, return_document=ReturnDocument.AFTER,
+    )
+    return doc["version"]
+
+def get_version(name: str) -> int:
+    doc = meta.find_one({"_id": name})
+    return doc["version"] if doc else 0
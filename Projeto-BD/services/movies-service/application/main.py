@@ -1,13 +1,35 @@
-from fastapi import FastAPI
-from .db import ensure_indexes
-from .movies.routes import router as movies_router
-from .reviews.routes import router as reviews_router
-
-api = FastAPI(title="movies-service")
-
-@api.on_event("startup")
-def startup():
-    ensure_indexes()
-
-api.include_router(movies_router, prefix="/movies", tags=["movies"])
+from fastapi import FastAPI
+from fastapi.middleware.gzip import GZipMiddleware
+import os
+from pymongo import DESCENDING
+from .db import ensure_indexes, warm_pool, get_version, movies
+from common.health import Step, install_health
+from common.profiling import install_profiling
+from .movies.titles import SEARCH_FIELDS_PROJECTION, backfill_title_fields
+from .movies.facets import ensure_facets, get_facets
+from .movies.routes import router as movies_router
+from .reviews.routes import router as reviews_router
+
+api = FastAPI(title="movies-service")
+# Comprime respostas (listas grandes) acima do limite em bytes
+api.add_middleware(GZipMiddleware, minimum_size=int(os.getenv("GZIP_MIN_SIZE", "1024")))
+install_profiling(api)
+
+def warm_cache():
+    # Traz para o cache do Mongo as páginas e índices das leituras mais comuns
+    get_version("movies")
+    get_facets()
+    list(movies.find({}, SEARCH_FIELDS_PROJECTION).limit(100))
+    list(movies.find({}, SEARCH_FIELDS_PROJECTION).sort([("rating_avg", DESCENDING), ("rating_count", DESCENDING)]).limit(100))
+
+install_health(
+    api,
+    Step("mongo_pool", warm_pool),
+    Step("indexes", ensure_indexes, once=True),
+    Step("title_backfill", backfill_title_fields, once=True),
+    Step("facets", ensure_facets, once=True),
+    Step("cache", warm_cache, required=False),
+)
+
+api.include_router(movies_router, prefix="/movies", tags=["movies"])
 api.include_router(reviews_router, prefix="/reviews", tags=["reviews"])
\ No newline at end of file
@@ -0,0 +1,110 @@
+"""
+Resumo materializado do catálogo em `movie_facets`: um documento por faceta
+({dim, genre, value}) com count, runtime_sum e runtime_count. genre=None são
+as facetas do catálogo inteiro; genre="Drama" são as facetas dentro do gênero.
+"""
+from pymongo import UpdateOne
+from ..db import movies, movie_facets
+
+def decade(year: int | None) -> int | None:
+    return year - year % 10 if year is not None else None
+
+def facet_keys(doc: dict) -> list[dict]:
+    year = doc.get("year")
+    genres = dict.fromkeys(doc.get("genres") or [])
+    keys = [
+        {"dim": "all", "genre": None, "value": None},
+        {"dim": "year", "genre": None, "value": year},
+        {"dim": "decade", "genre": None, "value": decade(year)},
+    ]
+    for g in genres:
+        keys.append({"dim": "genre", "genre": None, "value": g})
+        keys.append({"dim": "all", "genre": g, "value": None})
+        keys.append({"dim": "year", "genre": g, "value": year})
+        keys.append({"dim": "decade", "genre": g, "value": decade(year)})
+    return keys
+
+def apply_facets(doc: dict, sign: int):
+    """Soma (sign=1) ou subtrai (sign=-1) o filme de todas as suas facetas."""
+    runtime = doc.get("runtime")
+    inc = {
+        "count": sign,
+        "runtime_sum": sign * (runtime or 0),
+        "runtime_count": sign * (1 if runtime is not None else 0),
+    }
+    keys = facet_keys(doc)
+    movie_facets.bulk_write(
+        [UpdateOne({"_id": k}, {"$inc": inc, "$setOnInsert": k}, upsert=True) for k in keys],
+        ordered=False,
+    )
+    if sign < 0:
+        movie_facets.delete_many({"_id": {"$in": keys}, "count": {"$lte": 0}})
+
+def update_facets(old: dict, new: dict):
+    fields = ("year", "genres", "runtime")
+    if any(old.get(f) != new.get(f) for f in fields):
+        apply_facets(old, -1)
+        apply_facets(new, 1)
+
+def rebuild_facets():
+    """Recalcula todas as facetas a partir de `movies` com um pipeline de agregação."""
+    decade_expr = {"$subtract": ["$year", {"$mod": ["$year", 10]}]}
+    per_genre = lambda k: {
+        "$map": {"input": {"$setUnion": [{"$ifNull": ["$genres", []]}]}, "as": "g", "in": k},
+    }
+    movies.aggregate([
+        {"$project": {
+            "runtime": 1,
+            "keys": {"$concatArrays": [
+                [{"dim": "all", "genre": None, "value": None},
+                 {"dim": "year", "genre": None, "value": "$year"},
+                 {"dim": "decade", "genre": None, "value": decade_expr}],
+                per_genre({"dim": "genre", "genre": None, "value": "$$g"}),
+                per_genre({"dim": "all", "genre": "$$g", "value": None}),
+                per_genre({"dim": "year", "genre": "$$g", "value": "$year"}),
+                per_genre({"dim": "decade", "genre": "$$g", "value": decade_expr}),
+            ]},
+        }},
+        {"$unwind": "$keys"},
+        {"$group": {
+            "_id": "$keys",
+            "count": {"$sum": 1},
+            "runtime_sum": {"$sum": {"$ifNull": ["$runtime", 0]}},
+            "runtime_count": {"$sum": {"$cond": [{"$eq": [{"$ifNull": ["$runtime", None]}, None]}, 0, 1]}},
+        }},
+        {"$addFields": {"dim": "$_id.dim", "genre": "$_id.genre", "value": "$_id.value"}},
+        {"$out": movie_facets.name},
+    ])
+
+def ensure_facets():
+    if movie_facets.estimated_document_count() == 0 and movies.estimated_document_count() > 0:
+        rebuild_facets()
+
+def get_facets(genre: str | None = None) -> dict:
+    def entry(d):
+        rc = d.get("runtime_count", 0)
+        return {
+            "value": d.get("value"),
+            "count": d["count"],
+            "avg_runtime": (d.get("runtime_sum", 0) / rc) if rc > 0 else None,
+        }
+
+    result = {"genre": genre, "total": {"count": 0, "avg_runtime": None}, "years": [], "decades": []}
+    if genre is None:
+        result["genres"] = []
+
+    # Índice (genre, dim, value): só as facetas pedidas, já ordenadas
+    for d in movie_facets.find({"genre": genre}).sort([("dim", 1), ("value", 1)]):
+        dim = d["dim"]
+        if dim == "all":
+            total = entry(d)
+            del total["value"]
+            result["total"] = total
+        elif dim == "genre":
+            result["genres"].append(entry(d))
+        elif dim == "year":
+            result["years"].append(entry(d))
+        elif dim == "decade":
+            result["decades"].append(entry(d))
+
+    return result
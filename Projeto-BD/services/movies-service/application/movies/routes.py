@@ -1,92 +1,223 @@
-from fastapi import APIRouter, HTTPException
-from bson import ObjectId
-from ..db import movies
-from .schemas import MovieIn, MovieUpdate
-
-router = APIRouter()
-
-def oid(s: str):
-    try: return ObjectId(s)
-    except: raise HTTPException(400, "invalid id")
-
-@router.post("/", status_code=201)
-def create_movie(m: MovieIn):
-    existing = movies.find_one({"title": m.title})
-    if existing:
-        raise HTTPException(
-            status_code=400,
-            detail=f"movie with title '{m.title}' already exists"
-        )
-
-    doc = m.model_dump()
-    r = movies.insert_one(doc)
-    saved = movies.find_one({"_id": r.inserted_id})
-    saved["id"] = str(saved.pop("_id"))
-    return saved
-
-@router.get("/{movie_id}")
-def get_movie(movie_id: str):
-    doc = movies.find_one({"_id": oid(movie_id)})
-    if not doc: raise HTTPException(404, "not found")
-    doc["id"] = str(doc.pop("_id"))
-    return doc
-
-@router.get("/")
-def list_movies(title: str | None = None, genre: str | None = None, year: int | None = None, limit: int = 20, skip: int = 0):
-    query = {}
-
-    if title: 
-        query["$text"] = {"$search": title}
-    if genre:
-        query["genres"] = {"$in": [genre]}
-    if year:
-        query["year"] = year
-
-    cursor = movies.find(query).skip(skip).limit(limit)
-    res = []
-    for d in cursor:
-        d["id"] = str(d.pop("_id"))
-        res.append(d)
-    return res
-
-@router.put("/{movie_id}")
-def update_movie(movie_id: str, payload: MovieUpdate):
-    _id = oid(movie_id)
-
-    existing = movies.find_one({"_id": _id})
-    if not existing:
-        raise HTTPException(404, "not found")
-
-    # Se atualizar título, verificar duplicidade
-    if payload.title and payload.title != existing.get("title"):
-        other = movies.find_one({"title": payload.title})
-        if other:
-            raise HTTPException(
-                status_code=400,
-                detail=f"movie with title '{payload.title}' already exists"
-            )
-
-    update_data = payload.model_dump(exclude_none=True)
-
-    if not update_data:
-        return {**existing, "id": movie_id}  # nada para atualizar
-
-    movies.update_one({"_id": _id}, {"$set": update_data})
-
-    updated = movies.find_one({"_id": _id})
-    updated["id"] = str(updated.pop("_id"))
-    return updated
-
-
-@router.delete("/{movie_id}", status_code=204)
-def delete_movie(movie_id: str):
-    res = movies.delete_one({"_id": oid(movie_id)})
-    if res.deleted_count == 0:
-        raise HTTPException(404, "not found")
-
-
-# DELETA TODOS OS FILMES
-@router.delete("/movies/all", status_code=200)
-def delete_all_movies():
-    movies.delete_many({})
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from pymongo import UpdateOne, DESCENDING
+from bson import ObjectId
+from datetime import datetime, timezone
+import os, re
+from ..db import movies, movie_facets, bump_version, get_version
+from common.conditional import make_etag, etag_matches, not_modified
+from common.profiling import ProfilingRoute
+from .schemas import MovieIn, MovieUpdate, RatingSummaryIn
+from .facets import apply_facets, update_facets, rebuild_facets, get_facets
+from .titles import SEARCH_FIELDS_PROJECTION, normalize_title, title_fields
+
+router = APIRouter(route_class=ProfilingRoute)
+
+# Autocomplete: prefixo mínimo (normalizado) e teto de filmes lidos do índice
+# title_suffixes antes de ordenar, para um prefixo curto não ordenar o catálogo
+SUGGEST_MIN_PREFIX = 2
+SUGGEST_CANDIDATES = int(os.getenv("SUGGEST_CANDIDATES", "500"))
+
+def oid(s: str):
+    try: return ObjectId(s)
+    except: raise HTTPException(400, "invalid id")
+
+@router.post("/", status_code=201)
+def create_movie(m: MovieIn):
+    existing = movies.find_one({"title": m.title})
+    if existing:
+        raise HTTPException(
+            status_code=400,
+            detail=f"movie with title '{m.title}' already exists"
+        )
+
+    doc = m.model_dump()
+    doc["version"] = 1
+    doc["updated_at"] = datetime.now(timezone.utc)
+    doc.update(title_fields(m.title))
+    r = movies.insert_one(doc)
+    apply_facets(doc, 1)
+    bump_version("movies")
+    saved = movies.find_one({"_id": r.inserted_id}, SEARCH_FIELDS_PROJECTION)
+    saved["id"] = str(saved.pop("_id"))
+    return saved
+
+@router.get("/suggest")
+def suggest_titles(prefix: str = Query(..., min_length=SUGGEST_MIN_PREFIX), limit: int = Query(10, ge=1, le=50),
+                   boost: bool = False):
+    """
+    Autocomplete de títulos: prefixo normalizado (sem acento/caixa) casado
+    com o início de qualquer palavra do título, via índice em title_suffixes.
+    Títulos que começam com o prefixo vêm primeiro. Com boost=true, empates
+    são desfeitos pela quantidade de ratings (rating_count do documento).
+    A ordenação vale entre os primeiros SUGGEST_CANDIDATES filmes do índice.
+    """
+    norm = normalize_title(prefix)
+    if len(norm) < SUGGEST_MIN_PREFIX:
+        return []
+
+    pattern = "^" + re.escape(norm)
+    # Ordenação no próprio pipeline, sobre no máximo SUGGEST_CANDIDATES filmes
+    # lidos do índice (varredura limitada mesmo com prefixo de duas letras);
+    # $sort seguido de $limit mantém apenas os `limit` melhores em memória
+    title_norm = {"$ifNull": ["$title_norm", ""]}
+    candidates = movies.aggregate([
+        {"$match": {"title_suffixes": {"$regex": pattern}}},
+        {"$limit": max(SUGGEST_CANDIDATES, limit)},
+        {"$project": {
+            "title": 1,
+            "year": 1,
+            # 0 = o título começa com o prefixo, vem primeiro
+            "starts": {"$cond": [{"$regexMatch": {"input": title_norm, "regex": pattern}}, 0, 1]},
+            "popularity": {"$ifNull": ["$rating_count", 0]} if boost else {"$literal": 0},
+            "length": {"$strLenCP": title_norm},
+        }},
+        {"$sort": {"starts": 1, "popularity": -1, "length": 1, "title": 1}},
+        {"$limit": limit},
+    ])
+    return [
+        {"id": str(d["_id"]), "title": d.get("title"), "year": d.get("year")}
+        for d in candidates
+    ]
+
+@router.get("/facets")
+def list_facets(genre: str | None = None):
+    """
+    Contagem e runtime médio por gênero, ano e década, lidos do resumo
+    materializado. Com genre=X, as facetas de ano/década dentro do gênero.
+    """
+    return get_facets(genre)
+
+@router.post("/facets/rebuild")
+def rebuild_catalog_facets():
+    rebuild_facets()
+    return {"ok": True}
+
+@router.get("/{movie_id}")
+def get_movie(movie_id: str, request: Request, response: Response):
+    _id = oid(movie_id)
+
+    # Confere a versão antes de ler/serializar o documento inteiro
+    if request.headers.get("if-none-match"):
+        head = movies.find_one({"_id": _id}, {"version": 1})
+        if not head: raise HTTPException(404, "not found")
+        etag = make_etag("movie", movie_id, head.get("version", 0))
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+    doc = movies.find_one({"_id": _id}, SEARCH_FIELDS_PROJECTION)
+    if not doc: raise HTTPException(404, "not found")
+    doc["id"] = str(doc.pop("_id"))
+    response.headers["ETag"] = make_etag("movie", movie_id, doc.get("version", 0))
+    return doc
+
+@router.get("/")
+def list_movies(request: Request, response: Response,
+                title: str | None = None, genre: str | None = None, year: int | None = None, limit: int = 20, skip: int = 0,
+                min_rating: float | None = Query(None, ge=0, le=5), sort: str | None = Query(None, pattern="^rating$")):
+    # Qualquer escrita em movies incrementa a versão da coleção
+    etag = make_etag("movies", get_version("movies"), title, genre, year, limit, skip, min_rating, sort)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+
+    query = {}
+
+    if title: 
+        query["$text"] = {"$search": title}
+    if genre:
+        query["genres"] = {"$in": [genre]}
+    if year:
+        query["year"] = year
+    # Resumo de ratings embutido no documento (sincronizado pelo ratings-service)
+    if min_rating is not None:
+        query["rating_avg"] = {"$gte": min_rating}
+
+    cursor = movies.find(query, SEARCH_FIELDS_PROJECTION)
+    if sort == "rating":
+        cursor = cursor.sort([("rating_avg", DESCENDING), ("rating_count", DESCENDING)])
+    cursor = cursor.skip(skip).limit(limit)
+    res = []
+    for d in cursor:
+        d["id"] = str(d.pop("_id"))
+        res.append(d)
+    return res
+
+# Registrada antes de PUT /{movie_id} para "rating-summary" não ser lido como id
+@router.put("/rating-summary")
+def update_rating_summary(items: list[RatingSummaryIn]):
+    """
+    Recebe em lote o count/média de ratings de vários filmes (enviado pelo
+    ratings-service) e grava tudo em um único bulk_write. Filme cujo resumo
+    não mudou não casa com o filtro: nem o documento nem as versões (dele e
+    da coleção) mudam, e os ETags continuam valendo.
+    """
+    ops = []
+    for item in items:
+        if not ObjectId.is_valid(item.movie_id):
+            continue
+        avg = round(item.average, 4)
+        ops.append(UpdateOne(
+            {"_id": ObjectId(item.movie_id),
+             "$or": [{"rating_count": {"$ne": item.count}}, {"rating_avg": {"$ne": avg}}]},
+            {"$set": {"rating_count": item.count, "rating_avg": avg},
+             "$inc": {"version": 1}},
+        ))
+
+    if not ops:
+        return {"ok": True, "matched": 0, "modified": 0}
+
+    res = movies.bulk_write(ops, ordered=False)
+    if res.modified_count:
+        bump_version("movies")
+    return {"ok": True, "matched": res.matched_count, "modified": res.modified_count}
+
+@router.put("/{movie_id}")
+def update_movie(movie_id: str, payload: MovieUpdate):
+    _id = oid(movie_id)
+
+    existing = movies.find_one({"_id": _id})
+    if not existing:
+        raise HTTPException(404, "not found")
+
+    # Se atualizar título, verificar duplicidade
+    if payload.title and payload.title != existing.get("title"):
+        other = movies.find_one({"title": payload.title})
+        if other:
+            raise HTTPException(
+                status_code=400,
+                detail=f"movie with title '{payload.title}' already exists"
+            )
+
+    update_data = payload.model_dump(exclude_none=True)
+
+    if not update_data:
+        return {**existing, "id": movie_id}  # nada para atualizar
+
+    update_data["updated_at"] = datetime.now(timezone.utc)
+    if "title" in update_data:
+        update_data.update(title_fields(update_data["title"]))
+    movies.update_one({"_id": _id}, {"$set": update_data, "$inc": {"version": 1}})
+    bump_version("movies")
+
+    updated = movies.find_one({"_id": _id}, SEARCH_FIELDS_PROJECTION)
+    update_facets(existing, updated)
+    updated["id"] = str(updated.pop("_id"))
+    return updated
+
+
+@router.delete("/{movie_id}", status_code=204)
+def delete_movie(movie_id: str):
+    old = movies.find_one_and_delete({"_id": oid(movie_id)}, {"year": 1, "genres": 1, "runtime": 1})
+    if old is None:
+        raise HTTPException(404, "not found")
+    apply_facets(old, -1)
+    bump_version("movies")
+
+
+# DELETA TODOS OS FILMES
+@router.delete("/movies/all", status_code=200)
+def delete_all_movies():
+    movies.delete_many({})
+    movie_facets.delete_many({})
+    bump_version("movies")
     return {"ok": True, "deleted": "all movies"}
\ No newline at end of file
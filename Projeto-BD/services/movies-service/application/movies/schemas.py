@@ -1,17 +1,22 @@
-from pydantic import BaseModel
-
-class MovieIn(BaseModel):
-    title: str
-    year: int
-    genres: list[str] = []
-    cast: list[dict] | None = None
-    overview: str | None = None
-    runtime: int | None = None
-
-class MovieUpdate(BaseModel):
-    title: str | None = None
-    year: int | None = None
-    genres: list[str] = []
-    cast: list[dict] | None = None
-    overview: str | None = None
-    runtime: int | None = None
\ No newline at end of file
+from pydantic import BaseModel
+
+class MovieIn(BaseModel):
+    title: str
+    year: int
+    genres: list[str] = []
+    cast: list[dict] | None = None
+    overview: str | None = None
+    runtime: int | None = None
+
+class MovieUpdate(BaseModel):
+    title: str | None = None
+    year: int | None = None
+    genres: list[str] = []
+    cast: list[dict] | None = None
+    overview: str | None = None
+    runtime: int | None = None
+
+class RatingSummaryIn(BaseModel):
+    movie_id: str
+    count: int
+    average: float
\ No newline at end of file
@@ -0,0 +1,44 @@
+import re, unicodedata
+from pymongo import UpdateOne
+from ..db import movies
+
+# Campos internos de busca, omitidos das respostas da API
+SEARCH_FIELDS_PROJECTION = {"title_norm": 0, "title_suffixes": 0}
+
+def normalize_title(title: str) -> str:
+    # minúsculas, sem acentos e só letras/dígitos separados por um espaço
+    text = unicodedata.normalize("NFKD", title)
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return " ".join(re.findall(r"\w+", text))
+
+def title_fields(title: str) -> dict:
+    """
+    Campos de busca por prefixo gravados no documento do filme. Para
+    "O Poderoso Chefão": ["o poderoso chefao", "poderoso chefao", "chefao"],
+    ou seja, o título a partir do início de cada palavra. Um regex ^prefixo
+    sobre esse array (índice multikey) encontra o prefixo em qualquer palavra.
+    """
+    words = normalize_title(title).split()
+    return {
+        "title_norm": " ".join(words),
+        "title_suffixes": [" ".join(words[i:]) for i in range(len(words))],
+    }
+
+def backfill_title_fields(progress=lambda done, total: None, batch: int = 1000):
+    # Filmes gravados antes do autocomplete não têm os campos de busca
+    missing = {"title_suffixes": {"$exists": False}}
+    total = movies.count_documents(missing)
+    done = 0
+    ops = []
+    progress(done, total)
+    for doc in movies.find(missing, {"title": 1}):
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": title_fields(doc.get("title") or "")}))
+        if len(ops) >= batch:
+            movies.bulk_write(ops, ordered=False)
+            done += len(ops)
+            ops = []
+            progress(done, total)
+    if ops:
+        movies.bulk_write(ops, ordered=False)
+        done += len(ops)
+    progress(done, total)
@@ -0,0 +1,99 @@
+import os, time
+from .db import redis
+
+# Granularidades dos buckets de tendência: tamanho do bucket e retenção (segundos)
+TREND_GRANULARITIES = {
+    "hour": (3600, int(os.getenv("RATINGS_TREND_HOUR_RETENTION", str(14 * 86400)))),
+    "day": (86400, int(os.getenv("RATINGS_TREND_DAY_RETENTION", str(400 * 86400)))),
+}
+
+SCORES = range(1, 6)
+
+# Filmes com ratings alterados desde a última execução do job de similaridade
+# (hash tag: o job troca este conjunto pelo de processamento numa transação)
+SIMILARITY_DIRTY_KEY = "ratings:{similarity}:dirty"
+# Filmes cujo resumo (count/média) ainda não foi enviado ao movies-service
+SUMMARY_DIRTY_KEY = "ratings:summary:dirty"
+
+def histogram_key(movie_id: str) -> str:
+    return f"movie:{{{movie_id}}}:rating_hist"
+
+def trend_key(movie_id: str, granularity: str, bucket: int) -> str:
+    return f"movie:{{{movie_id}}}:rating_trend:{granularity}:{bucket}"
+
+def version_key(movie_id: str) -> str:
+    return f"movie:{{{movie_id}}}:rating_version"
+
+def similar_key(movie_id: str) -> str:
+    return f"movie:{{{movie_id}}}:rating_similar"
+
+def bucket_start(ts: int, size: int) -> int:
+    return ts - (ts % size)
+
+
+def queue_score_change(pipe, movie_id: str,
+                       prev_score: int | None = None, prev_ts: int | None = None,
+                       new_score: int | None = None, new_ts: int | None = None):
+    """
+    Enfileira no pipeline as atualizações de histograma e buckets de tendência
+    para a troca de prev_score (no instante prev_ts) por new_score (em new_ts)
+    e incrementa o contador de versão. Só toca chaves do filme (mesmo slot),
+    então cabe na transação do filme; as marcações globais ficam em mark_dirty.
+    prev_score=None é um rating novo; new_score=None é uma remoção.
+    """
+    # Contador de alterações usado no ETag de GET /ratings/{movie_id}
+    pipe.incr(version_key(movie_id))
+
+    hkey = histogram_key(movie_id)
+    if prev_score is not None:
+        pipe.hincrby(hkey, str(prev_score), -1)
+    if new_score is not None:
+        pipe.hincrby(hkey, str(new_score), 1)
+
+    now = int(time.time())
+    for granularity, (size, retention) in TREND_GRANULARITIES.items():
+        # Ratings antigos cujo bucket já expirou não são descontados
+        if prev_score is not None and prev_ts is not None and prev_ts > now - retention:
+            key = trend_key(movie_id, granularity, bucket_start(prev_ts, size))
+            pipe.hincrby(key, "count", -1)
+            pipe.hincrby(key, "sum", -prev_score)
+        if new_score is not None and new_ts is not None:
+            bucket = bucket_start(new_ts, size)
+            key = trend_key(movie_id, granularity, bucket)
+            pipe.hincrby(key, "count", 1)
+            pipe.hincrby(key, "sum", new_score)
+            pipe.expireat(key, bucket + size + retention)
+
+
+def mark_dirty(pipe, *movie_ids: str):
+    # Marca os filmes para o próximo job de similaridade e para a
+    # sincronização do resumo com o movies-service
+    pipe.sadd(SIMILARITY_DIRTY_KEY, *movie_ids)
+    pipe.sadd(SUMMARY_DIRTY_KEY, *movie_ids)
+
+
+def get_histogram(movie_id: str) -> dict[int, int]:
+    data = redis.hgetall(histogram_key(movie_id))
+    return {s: int(data.get(str(s), 0)) for s in SCORES}
+
+
+def get_trend(movie_id: str, granularity: str, buckets: int) -> list[dict]:
+    size, _ = TREND_GRANULARITIES[granularity]
+    last = bucket_start(int(time.time()), size)
+    starts = [last - i * size for i in reversed(range(buckets))]
+
+    pipe = redis.pipeline(transaction=False)
+    for start in starts:
+        pipe.hmget(trend_key(movie_id, granularity, start), "count", "sum")
+
+    result = []
+    for start, (count_str, sum_str) in zip(starts, pipe.execute()):
+        count = int(count_str or 0)
+        sum_ = int(sum_str or 0)
+        result.append({
+            "bucket_start": start,
+            "count": count,
+            "sum": sum_,
+            "average": (sum_ / count) if count > 0 else 0.0,
+        })
+    return result
@@ -0,0 +1,147 @@
+from redis import Redis, BlockingConnectionPool
+from redis.cluster import RedisCluster
+from redis.connection import Connection
+from redis.crc import key_slot
+from redis.exceptions import WatchError
+import heapq, itertools, os, time, zlib
+from common.profiling import PROFILING_ENABLED, add_time
+from common.workers import per_worker
+
+class TimedConnection(Connection):
+    # Soma o tempo de ida/volta ao Redis no perfil da request (só com profiling ligado)
+    def send_packed_command(self, command, check_health=True):
+        started = time.perf_counter()
+        try:
+            return super().send_packed_command(command, check_health)
+        finally:
+            add_time("db", time.perf_counter() - started)
+
+    def read_response(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().read_response(*args, **kwargs)
+        finally:
+            add_time("db", time.perf_counter() - started)
+
+# Com REDIS_CLUSTER=1 o cliente descobre os nós a partir de REDIS_HOST:REDIS_PORT
+# e roteia cada comando pelo slot da chave
+REDIS_CLUSTER = os.getenv("REDIS_CLUSTER", "0") == "1"
+REDIS_HOST = os.getenv("REDIS_HOST", "redis")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+connection_class = TimedConnection if PROFILING_ENABLED else Connection
+# Total do container (por nó no cluster), dividido entre os workers (ver workers.py)
+REDIS_MAX_CONNECTIONS = per_worker(int(os.getenv("REDIS_MAX_CONNECTIONS", "200")))
+
+if REDIS_CLUSTER:
+    redis = RedisCluster(
+        host=REDIS_HOST, port=REDIS_PORT, decode_responses=True, connection_class=connection_class,
+        max_connections=REDIS_MAX_CONNECTIONS,
+    )
+else:
+    # Pool cheio espera uma conexão livre em vez de falhar
+    redis = Redis(connection_pool=BlockingConnectionPool(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        db=int(os.getenv("REDIS_DB", "0")),
+        decode_responses=True,
+        connection_class=connection_class,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=float(os.getenv("REDIS_POOL_TIMEOUT", "5")),
+    ))
+
+def transaction(key: str):
+    """
+    Pipeline MULTI/EXEC no nó dono de `key`. No cluster uma transação só
+    pode tocar chaves do mesmo slot: as chaves de um filme compartilham a
+    hash tag {movie_id} (ver abaixo), então transaction(count_key(m)) cobre
+    rating, agregados, histograma, tendência e versão do filme.
+    """
+    if REDIS_CLUSTER:
+        return redis.get_redis_connection(redis.get_node_from_key(key)).pipeline(transaction=True)
+    return redis.pipeline(transaction=True)
+
+def watched_transaction(key: str, fn, *watches: str):
+    """
+    Read-modify-write otimista no nó de `key`: WATCH em `watches`, `fn(pipe)`
+    lê os valores atuais (o pipeline executa na hora até o multi()), chama
+    pipe.multi() e enfileira as escritas. Se alguma chave vigiada mudou antes
+    do EXEC, a leitura e as escritas são refeitas. Devolve (retorno de fn,
+    resultados do EXEC). As chaves vigiadas devem estar no slot de `key`.
+    """
+    while True:
+        with transaction(key) as pipe:
+            try:
+                pipe.watch(*watches)
+                value = fn(pipe)
+                return value, pipe.execute()
+            except WatchError:
+                continue
+
+def slot_group(key: str) -> int:
+    # Chaves com o mesmo valor podem ir na mesma transação
+    return key_slot(key.encode()) if REDIS_CLUSTER else 0
+
+REDIS_WARM_CONNECTIONS = min(per_worker(int(os.getenv("REDIS_WARM_CONNECTIONS", "10"))), REDIS_MAX_CONNECTIONS)
+
+def warm_pool():
+    # get_connection já conecta e valida; devolvidas ao pool, ficam abertas
+    if REDIS_CLUSTER:
+        pools = [node.redis_connection.connection_pool for node in redis.get_primaries()]
+    else:
+        pools = [redis.connection_pool]
+    for pool in pools:
+        conns = [pool.get_connection("PING") for _ in range(REDIS_WARM_CONNECTIONS)]
+        for conn in conns:
+            pool.release(conn)
+
+
+# Layout de chaves: tudo de um filme leva a hash tag {movie_id} e cai no mesmo
+# slot do cluster, o que permite pipelines e transações por filme.
+#   rating:{m}:user:{u}          hash do rating
+#   movie:{m}:rating_count/_sum  agregados (e rating_hist, rating_trend:..., etc.)
+def rating_key(movie_id: str, user_id: str) -> str:
+    return f"rating:{{{movie_id}}}:user:{user_id}"
+
+def count_key(movie_id: str) -> str:
+    return f"movie:{{{movie_id}}}:rating_count"
+
+def sum_key(movie_id: str) -> str:
+    return f"movie:{{{movie_id}}}:rating_sum"
+
+def key_movie_id(key: str) -> str:
+    # movie_id dentro da hash tag de qualquer chave acima
+    return key[key.index("{") + 1:key.index("}")]
+
+def key_user_id(key: str) -> str:
+    # rating:{movie_id}:user:{user_id}
+    return key.split(":user:", 1)[1]
+
+
+# Leaderboard global por média dividido em LEADERBOARD_PARTITIONS sorted sets
+# parciais ({lb0}, {lb1}, ... espalhados pelos nós); top_movies junta na leitura
+LEADERBOARD_KEY = "top:avg_ratings"
+LEADERBOARD_PARTITIONS = int(os.getenv("RATINGS_LEADERBOARD_PARTITIONS", "16"))
+
+def leaderboard_partition_key(partition: int) -> str:
+    return f"{LEADERBOARD_KEY}:{{lb{partition}}}"
+
+def leaderboard_key(movie_id: str) -> str:
+    return leaderboard_partition_key(zlib.crc32(movie_id.encode()) % LEADERBOARD_PARTITIONS)
+
+def leaderboard_keys() -> list[str]:
+    return [leaderboard_partition_key(p) for p in range(LEADERBOARD_PARTITIONS)]
+
+def update_leaderboard(pipe, averages: dict[str, float]):
+    partitions = {}
+    for movie_id, avg in averages.items():
+        partitions.setdefault(leaderboard_key(movie_id), {})[movie_id] = float(avg)
+    for key, mapping in partitions.items():
+        pipe.zadd(key, mapping)
+
+def top_movies(limit: int, offset: int = 0) -> list[tuple[str, float]]:
+    """Top global: os `offset + limit` primeiros de cada parcial, intercalados por média."""
+    pipe = redis.pipeline(transaction=False)
+    for key in leaderboard_keys():
+        pipe.zrevrange(key, 0, offset + limit - 1, withscores=True)
+    merged = heapq.merge(*pipe.execute(), key=lambda item: -item[1])
+    return list(itertools.islice(merged, offset, offset + limit))
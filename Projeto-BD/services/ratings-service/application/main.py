@@ -1,352 +1,530 @@
-from fastapi import FastAPI, APIRouter, HTTPException
-from pydantic import BaseModel, Field
-from redis import Redis
-import os, time, requests
-from .schemas import RatingIn, RatingUpdate
-
-api = FastAPI(title="ratings-service")
-router = APIRouter()
-
-redis = Redis(
-    host=os.getenv("REDIS_HOST", "redis"),
-    port=int(os.getenv("REDIS_PORT", "6379")),
-    db=int(os.getenv("REDIS_DB", "0")),
-    decode_responses=True, 
-)
-
-def rating_key(movie_id: str, user_id: str) -> str:
-    return f"rating:movie:{movie_id}:user:{user_id}"
-
-def fetch_movie_name(movie_id: str) -> str | None:
-    try:
-        req = requests.get(f"http://movies-service:8000/movies/{movie_id}", timeout=2)
-        if req.status_code == 200:
-            data = req.json()
-            return data.get("title")
-    except Exception as err:
-        print("Erro ao consultar movies-service:", err)
-    return None
-
-
-@router.post("/ratings", status_code=201)
-def rate(payload: RatingIn):
-    key = rating_key(payload.movie_id, payload.user_id)
-
-    # Lê rating anterior se existir
-    prev_score_str = redis.hget(key, "score")
-    prev_score = int(prev_score_str) if prev_score_str is not None else None
-
-    # Salva/atualiza rating no hash
-    now_ts = int(time.time())
-    redis.hset(
-        key,
-        mapping={
-            "score": int(payload.score),
-            "comment": (payload.comment or ""),
-            "time_stamp": now_ts,
-        },
-    )
-
-    # Chaves de agregados do filme
-    ckey = f"movie:{payload.movie_id}:rating_count"
-    skey = f"movie:{payload.movie_id}:rating_sum"
-
-    pipe = redis.pipeline()
-    if prev_score is None:
-        # Novo rating: incrementa count e soma
-        pipe.incr(ckey)
-        pipe.incrby(skey, int(payload.score))
-    else:
-        delta = int(payload.score) - prev_score
-        if delta != 0:
-            pipe.incrby(skey, delta)
-
-    pipe.get(ckey)
-    pipe.get(skey)
-    res = pipe.execute()
-
-    if prev_score is None:
-        # res = [new_count, new_sum, count_str, sum_str]
-        count_str, sum_str = res[-2], res[-1]
-    else:
-        # res = [maybe_new_sum, count_str, sum_str]  (quando delta=0, o primeiro é None)
-        count_str, sum_str = res[-2], res[-1]
-
-    try:
-        count = int(count_str or 0)
-        sum_  = int(sum_str or 0)
-    except ValueError:
-        raise HTTPException(status_code=500, detail="Agregados inválidos no Redis.")
-
-    avg = (sum_ / count) if count > 0 else 0.0
-
-    # Atualiza leaderboard por média
-    redis.zadd("top:avg_ratings", {payload.movie_id: float(avg)})
-
-    movie_name = fetch_movie_name(payload.movie_id)
-
-    return {
-        "movie_name": movie_name,
-        **payload.dict()
-    }
-
-@router.get("/ratings/{movie_id}/{user_id}")
-def get_user_rating(movie_id: str, user_id: str):
-    key = rating_key(movie_id, user_id)
-    data = redis.hgetall(key)
-
-    if not data:
-        raise HTTPException(status_code=404, detail="Rating não encontrado.")
-
-    return {
-        "movie_id": movie_id,
-        "user_id": user_id,
-        "score": int(data.get("score", 0)),
-        "comment": data.get("comment", ""),
-    }
-
-@router.get("/ratings/{movie_id}")
-def get_movie_ratings(movie_id: str):    
-    movie_name = fetch_movie_name(movie_id)
-
-    if movie_name is None:
-        raise HTTPException(status_code=404, detail="Movie not found")
-    
-    ckey = f"movie:{movie_id}:rating_count"
-    skey = f"movie:{movie_id}:rating_sum"
-
-    count_str = redis.get(ckey)
-    sum_str   = redis.get(skey)
-
-    count = int(count_str or 0)
-    sum_  = int(sum_str or 0)
-
-    avg = (sum_ / count) if count > 0 else 0.0
-
-    return {
-        "movie_name": movie_name,
-        "movie_id": movie_id,
-        "count": count,
-        "sum": sum_,
-        "average": avg,
-    }
-
-@router.put("/ratings/{movie_id}/{user_id}")
-def update_rating(movie_id: str, user_id: str, payload: RatingUpdate):
-    key = rating_key(movie_id, user_id)
-
-    # Pega rating anterior
-    prev_data = redis.hgetall(key)
-    if not prev_data:
-        raise HTTPException(status_code=404, detail="Rating não encontrado.")
-
-    prev_score = int(prev_data.get("score", 0))
-
-    # Score novo (mantém o anterior se não enviado)
-    new_score = payload.score if payload.score is not None else prev_score
-
-    # Salva o rating atualizado
-    now_ts = int(time.time())
-    redis.hset(
-        key,
-        mapping={
-            "score": new_score,
-            "comment": payload.comment if payload.comment is not None else prev_data.get("comment", ""),
-            "ts": now_ts,
-        },
-    )
-
-    # Atualização de agregados
-    ckey = f"movie:{movie_id}:rating_count"
-    skey = f"movie:{movie_id}:rating_sum"
-
-    delta = new_score - prev_score
-
-    pipe = redis.pipeline()
-    if delta != 0:
-        pipe.incrby(skey, delta)
-
-    pipe.get(ckey)
-    pipe.get(skey)
-    res = pipe.execute()
-
-    count_str, sum_str = res[-2], res[-1]
-
-    count = int(count_str or 0)
-    sum_ = int(sum_str or 0)
-
-    avg = (sum_ / count) if count > 0 else 0.0
-
-    # Atualiza leaderboard
-    redis.zadd("top:avg_ratings", {movie_id: float(avg)})
-
-    movie_name = fetch_movie_name(movie_id)
-
-    return {
-        "movie_name": movie_name,
-        "movie_id": movie_id,
-        "user_id": user_id,
-        "score": new_score,
-        "comment": payload.comment if payload.comment is not None else prev_data.get("comment", ""),
-        "average": avg,
-        "count": count,
-    }
-
-# DELETA UM RATING DE UM USUÁRIO PARA UM FILME
-@router.delete("/ratings/{movie_id}/{user_id}", status_code=200)
-def delete_rating(movie_id: str, user_id: str):
-    key = rating_key(movie_id, user_id)
-
-    # Busca rating existente
-    data = redis.hgetall(key)
-    if not data:
-        raise HTTPException(status_code=404, detail="Rating não encontrado.")
-
-    try:
-        prev_score = int(data.get("score", 0))
-    except ValueError:
-        prev_score = 0
-
-    # Remove o rating
-    redis.delete(key)
-
-    # Atualiza agregados
-    ckey = f"movie:{movie_id}:rating_count"
-    skey = f"movie:{movie_id}:rating_sum"
-
-    pipe = redis.pipeline()
-    pipe.decr(ckey)
-    pipe.decrby(skey, prev_score)
-    pipe.get(ckey)
-    pipe.get(skey)
-    res = pipe.execute()
-
-    new_count_str, new_sum_str = res[-2], res[-1]
-    new_count = int(new_count_str or 0)
-    new_sum   = int(new_sum_str or 0)
-
-    # Recalcula média
-    new_avg = (new_sum / new_count) if new_count > 0 else 0.0
-
-    # Atualiza leaderboard
-    redis.zadd("top:avg_ratings", {movie_id: float(new_avg)})
-
-    movie_name = fetch_movie_name(movie_id)
-
-    return {
-        "message": "Rating removido com sucesso.",
-        "movie_id": movie_id,
-        "movie_name": movie_name,
-        "user_id": user_id,
-        "new_count": new_count,
-        "new_sum": new_sum,
-        "new_average": new_avg,
-    }
-
-# DELETA TODOS OS RATINGS DE UM FILME
-@router.delete("/ratings/movie/{movie_id}", status_code=200)
-def delete_all_ratings_for_movie(movie_id: str):
-    pattern = f"rating:movie:{movie_id}:user:*"
-    keys = redis.keys(pattern)
-
-    deleted = 0
-    total_removed_score = 0
-
-    for key in keys:
-        data = redis.hgetall(key)
-        if data:
-            try:
-                total_removed_score += int(data.get("score", 0))
-            except ValueError:
-                pass
-        redis.delete(key)
-        deleted += 1
-
-    # zera agregados
-    ckey = f"movie:{movie_id}:rating_count"
-    skey = f"movie:{movie_id}:rating_sum"
-    redis.set(ckey, 0)
-    redis.set(skey, 0)
-
-    # média agora é 0
-    redis.zadd("top:avg_ratings", {movie_id: 0.0})
-
-    movie_name = fetch_movie_name(movie_id)
-
-    return {
-        "message": "Todos os ratings deste filme foram removidos.",
-        "movie_id": movie_id,
-        "movie_name": movie_name,
-        "removed_ratings": deleted,
-        "removed_score_sum": total_removed_score,
-        "new_count": 0,
-        "new_sum": 0,
-        "new_avg": 0.0,
-    }
-
-# DELETA TODOS OS RATINGS DE UM USUÁRIO
-@router.delete("/ratings/user/{user_id}", status_code=200)
-def delete_all_ratings_from_user(user_id: str):
-
-    pattern = f"rating:movie:*:user:{user_id}"
-    keys = redis.keys(pattern)
-
-    affected_movies = {}
-
-    for key in keys:
-        parts = key.split(":")
-        # rating:movie:{movie_id}:user:{user_id}
-        movie_id = parts[2]
-
-        data = redis.hgetall(key)
-        prev_score = int(data.get("score", 0)) if data else 0
-
-        # remover rating
-        redis.delete(key)
-
-        # atualizar agregados do filme
-        ckey = f"movie:{movie_id}:rating_count"
-        skey = f"movie:{movie_id}:rating_sum"
-
-        pipe = redis.pipeline()
-        pipe.decr(ckey)
-        pipe.decrby(skey, prev_score)
-        pipe.get(ckey)
-        pipe.get(skey)
-        res = pipe.execute()
-
-        new_count = int(res[-2] or 0)
-        new_sum = int(res[-1] or 0)
-        new_avg = (new_sum / new_count) if new_count > 0 else 0.0
-
-        # atualizar leaderboard
-        redis.zadd("top:avg_ratings", {movie_id: new_avg})
-
-        affected_movies[movie_id] = {
-            "new_count": new_count,
-            "new_sum": new_sum,
-            "new_avg": new_avg,
-        }
-
-    return {
-        "message": "Todos os ratings do usuário foram removidos.",
-        "user_id": user_id,
-        "affected_movies": affected_movies,
-    }
-
-# DELETA TODAS AS RATINGS
-@router.delete("/ratings/all", status_code=200)
-def delete_all_ratings():
-    # apaga ratings, agregados, leaderboard
-    for key in redis.keys("rating:*"):
-        redis.delete(key)
-
-    for key in redis.keys("movie:*:rating_*"):
-        redis.delete(key)
-
-    redis.delete("top:avg_ratings")
-
-    return {"ok": True, "deleted": "all ratings"}
-
-
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Request, Response
+from pydantic import BaseModel, Field
+import os, threading, time, requests
+from .db import (
+    redis, watched_transaction, warm_pool, rating_key, count_key, sum_key, key_movie_id,
+    leaderboard_keys, update_leaderboard, top_movies,
+)
+from .aggregates import (
+    TREND_GRANULARITIES, SIMILARITY_DIRTY_KEY, SUMMARY_DIRTY_KEY, histogram_key, trend_key, similar_key, version_key,
+    queue_score_change, mark_dirty, get_histogram, get_trend,
+)
+from .schemas import RatingIn, RatingUpdate
+from common.conditional import make_etag, etag_matches, not_modified, opaque_tag
+from common.health import Step, install_health
+from common.profiling import ProfilingRoute, install_profiling, timed
+from .stream import WRITE_BEHIND, STREAM_KEY, STREAM_RETRY_AFTER, ensure_group, enqueue_rating, lag_exceeded, stream_stats
+
+api = FastAPI(title="ratings-service")
+router = APIRouter(route_class=ProfilingRoute)
+install_profiling(api)
+
+# movie_id -> (etag, título, quando foi validado); dentro de MOVIE_CACHE_TTL
+# segundos é usado direto, depois é revalidado com If-None-Match
+MOVIE_CACHE_SIZE = int(os.getenv("MOVIE_CACHE_SIZE", "10000"))
+MOVIE_CACHE_TTL = float(os.getenv("MOVIE_CACHE_TTL", "5"))
+movie_cache: dict[str, tuple[str, str | None, float]] = {}
+# endpoints sync rodam no threadpool: a remoção do mais antigo não pode correr em paralelo
+movie_cache_lock = threading.Lock()
+
+def cached_movie(movie_id: str) -> tuple[str | None, str] | None:
+    """(título, etag) do cache se ainda estiver dentro do TTL, sem ir ao movies-service."""
+    cached = movie_cache.get(movie_id)
+    if cached and time.monotonic() - cached[2] < MOVIE_CACHE_TTL:
+        return cached[1], cached[0]
+    return None
+
+def remember_movie(movie_id: str, etag: str, title: str | None):
+    with movie_cache_lock:
+        if movie_id not in movie_cache and len(movie_cache) >= MOVIE_CACHE_SIZE:
+            movie_cache.pop(next(iter(movie_cache)), None)
+        movie_cache[movie_id] = (etag, title, time.monotonic())
+
+def fetch_movie(movie_id: str) -> tuple[str | None, str | None]:
+    """Retorna (título, etag) do filme no movies-service."""
+    fresh = cached_movie(movie_id)
+    if fresh:
+        return fresh
+    cached = movie_cache.get(movie_id)
+    headers = {"If-None-Match": cached[0]} if cached else {}
+    try:
+        with timed("http"):
+            req = requests.get(f"http://movies-service:8000/movies/{movie_id}", headers=headers, timeout=2)
+        title = req.json().get("title") if req.status_code == 200 else None
+    except (requests.RequestException, ValueError) as err:
+        print("Erro ao consultar movies-service:", err)
+        return None, None
+
+    # manutenção do cache fora do except: um erro aqui não vira "filme não encontrado"
+    if req.status_code == 304 and cached:
+        remember_movie(movie_id, cached[0], cached[1])
+        return cached[1], cached[0]
+    if req.status_code == 200:
+        etag = req.headers.get("etag")
+        if etag:
+            remember_movie(movie_id, etag, title)
+        return title, etag
+    movie_cache.pop(movie_id, None)
+    return None, None
+
+def fetch_movie_name(movie_id: str) -> str | None:
+    return fetch_movie(movie_id)[0]
+
+WARM_TITLES = int(os.getenv("RATINGS_WARM_TITLES", "200"))
+
+def warm_titles(progress):
+    # Títulos dos filmes mais bem avaliados, os mais consultados; com o
+    # movies-service ainda aquecendo, pula em vez de esperar cada timeout
+    requests.get("http://movies-service:8000/readyz", timeout=2).raise_for_status()
+    top = [movie_id for movie_id, _ in top_movies(WARM_TITLES)]
+    for i, movie_id in enumerate(top):
+        progress(i, len(top))
+        fetch_movie(movie_id)
+    progress(len(top), len(top))
+
+install_health(
+    api,
+    Step("redis_pool", warm_pool),
+    *([Step("stream_group", ensure_group)] if WRITE_BEHIND else []),
+    Step("title_cache", warm_titles, required=False),
+)
+
+
+@router.post("/ratings", status_code=201)
+def rate(payload: RatingIn, response: Response):
+    if WRITE_BEHIND:
+        return enqueue(payload, response)
+
+    key = rating_key(payload.movie_id, payload.user_id)
+
+    # Chaves de agregados do filme
+    ckey = count_key(payload.movie_id)
+    skey = sum_key(payload.movie_id)
+    score = int(payload.score)
+
+    def apply(pipe):
+        # Lê rating anterior se existir (sob WATCH: outra escrita no mesmo
+        # rating antes do EXEC faz a leitura e as escritas serem refeitas)
+        prev_score_str, prev_ts_str = pipe.hmget(key, "score", "time_stamp")
+        prev_score = int(prev_score_str) if prev_score_str is not None else None
+        prev_ts = int(prev_ts_str) if prev_ts_str else None
+
+        # Chaves do filme compartilham a hash tag: uma transação no slot do filme
+        now_ts = int(time.time())
+        pipe.multi()
+        pipe.hset(
+            key,
+            mapping={
+                "score": score,
+                "comment": (payload.comment or ""),
+                "time_stamp": now_ts,
+            },
+        )
+        if prev_score is None:
+            # Novo rating: incrementa count e soma
+            pipe.incr(ckey)
+            pipe.incrby(skey, score)
+        elif score != prev_score:
+            pipe.incrby(skey, score - prev_score)
+
+        # Histograma e buckets de tendência
+        queue_score_change(pipe, payload.movie_id, prev_score, prev_ts, score, now_ts)
+
+        pipe.get(ckey)
+        pipe.get(skey)
+
+    _, res = watched_transaction(ckey, apply, key)
+    count_str, sum_str = res[-2], res[-1]
+
+    try:
+        count = int(count_str or 0)
+        sum_  = int(sum_str or 0)
+    except ValueError:
+        raise HTTPException(status_code=500, detail="Agregados inválidos no Redis.")
+
+    avg = (sum_ / count) if count > 0 else 0.0
+
+    # Leaderboard e marcações globais ficam em outros slots: fora da transação
+    pipe = redis.pipeline(transaction=False)
+    update_leaderboard(pipe, {payload.movie_id: avg})
+    mark_dirty(pipe, payload.movie_id)
+    pipe.execute()
+
+    movie_name = fetch_movie_name(payload.movie_id)
+
+    return {
+        "movie_name": movie_name,
+        **payload.dict()
+    }
+
+def enqueue(payload: RatingIn, response: Response):
+    # Write-behind: o worker aplica hash, agregados e leaderboard depois
+    if lag_exceeded():
+        raise HTTPException(
+            status_code=503,
+            detail="Fila de ratings acima do lag máximo, tente novamente.",
+            headers={"Retry-After": str(STREAM_RETRY_AFTER)},
+        )
+
+    entry_id = enqueue_rating(payload.movie_id, payload.user_id, payload.score, payload.comment)
+    response.status_code = 202
+
+    return {
+        "queued": True,
+        "entry_id": entry_id,
+        **payload.dict()
+    }
+
+@router.get("/ratings/stream/stats")
+def get_stream_stats():
+    return stream_stats()
+
+# Registrada antes de /ratings/{movie_id} para "top" não ser lido como movie_id
+@router.get("/ratings/top")
+def get_top_movies(limit: int = Query(10, ge=1, le=100), offset: int = Query(0, ge=0, le=1000)):
+    # Leaderboard global montado a partir das partições (ver db.top_movies)
+    return [
+        {"movie_id": movie_id, "average": avg}
+        for movie_id, avg in top_movies(limit, offset)
+    ]
+
+# Registradas antes de /ratings/{movie_id}/{user_id} para não colidirem com user_id
+@router.get("/ratings/{movie_id}/histogram")
+def get_movie_histogram(movie_id: str):
+    histogram = get_histogram(movie_id)
+    count = sum(histogram.values())
+    sum_ = sum(score * n for score, n in histogram.items())
+
+    return {
+        "movie_id": movie_id,
+        "histogram": histogram,
+        "count": count,
+        "average": (sum_ / count) if count > 0 else 0.0,
+    }
+
+@router.get("/ratings/{movie_id}/trend")
+def get_movie_trend(movie_id: str, granularity: str = "day", buckets: int = Query(7, ge=1, le=366)):
+    if granularity not in TREND_GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity deve ser um de {list(TREND_GRANULARITIES)}")
+
+    return {
+        "movie_id": movie_id,
+        "granularity": granularity,
+        "buckets": get_trend(movie_id, granularity, buckets),
+    }
+
+@router.get("/ratings/{movie_id}/similar")
+def get_similar_movies(movie_id: str, limit: int = Query(10, ge=1, le=100)):
+    # Vizinhos pré-calculados pelo job application.similarity
+    neighbours = redis.zrevrange(similar_key(movie_id), 0, limit - 1, withscores=True)
+
+    return {
+        "movie_id": movie_id,
+        "similar": [{"movie_id": m, "similarity": score} for m, score in neighbours],
+    }
+
+@router.get("/ratings/{movie_id}/{user_id}")
+def get_user_rating(movie_id: str, user_id: str):
+    key = rating_key(movie_id, user_id)
+    data = redis.hgetall(key)
+
+    if not data:
+        raise HTTPException(status_code=404, detail="Rating não encontrado.")
+
+    return {
+        "movie_id": movie_id,
+        "user_id": user_id,
+        "score": int(data.get("score", 0)),
+        "comment": data.get("comment", ""),
+    }
+
+def ratings_etag(movie_id: str, version, movie_etag: str | None) -> str:
+    # versão dos ratings do filme + ETag do documento do filme (título)
+    return make_etag("ratings", movie_id, version, opaque_tag(movie_etag or ""))
+
+@router.get("/ratings/{movie_id}")
+def get_movie_ratings(movie_id: str, request: Request, response: Response):
+    version = redis.get(version_key(movie_id)) or 0
+
+    # If-None-Match antes de ir ao movies-service: com o filme no cache dentro
+    # do TTL, um cliente com a versão atual recebe 304 sem chamada de saída
+    fresh = cached_movie(movie_id)
+    if fresh and etag_matches(request, ratings_etag(movie_id, version, fresh[1])):
+        return not_modified(ratings_etag(movie_id, version, fresh[1]))
+
+    movie_name, movie_etag = fetch_movie(movie_id)
+
+    if movie_name is None:
+        raise HTTPException(status_code=404, detail="Movie not found")
+
+    etag = ratings_etag(movie_id, version, movie_etag)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+
+    ckey = count_key(movie_id)
+    skey = sum_key(movie_id)
+
+    count_str, sum_str = redis.mget(ckey, skey)
+
+    count = int(count_str or 0)
+    sum_  = int(sum_str or 0)
+
+    avg = (sum_ / count) if count > 0 else 0.0
+
+    return {
+        "movie_name": movie_name,
+        "movie_id": movie_id,
+        "count": count,
+        "sum": sum_,
+        "average": avg,
+    }
+
+@router.put("/ratings/{movie_id}/{user_id}")
+def update_rating(movie_id: str, user_id: str, payload: RatingUpdate):
+    key = rating_key(movie_id, user_id)
+
+    # Atualização de agregados
+    ckey = count_key(movie_id)
+    skey = sum_key(movie_id)
+
+    def apply(pipe):
+        # Pega rating anterior (sob WATCH, como em rate)
+        prev_data = pipe.hgetall(key)
+        if not prev_data:
+            raise HTTPException(status_code=404, detail="Rating não encontrado.")
+
+        prev_score = int(prev_data.get("score", 0))
+        prev_ts_str = prev_data.get("time_stamp") or prev_data.get("ts")
+        prev_ts = int(prev_ts_str) if prev_ts_str else None
+
+        # Score e comentário novos (mantém os anteriores se não enviados)
+        new_score = payload.score if payload.score is not None else prev_score
+        comment = payload.comment if payload.comment is not None else prev_data.get("comment", "")
+
+        # Salva o rating atualizado junto com os agregados
+        now_ts = int(time.time())
+        pipe.multi()
+        pipe.hset(
+            key,
+            mapping={
+                "score": new_score,
+                "comment": comment,
+                "time_stamp": now_ts,
+            },
+        )
+        if new_score != prev_score:
+            pipe.incrby(skey, new_score - prev_score)
+
+        # O rating passa para o bucket de tendência atual
+        queue_score_change(pipe, movie_id, prev_score, prev_ts, new_score, now_ts)
+
+        pipe.get(ckey)
+        pipe.get(skey)
+        return new_score, comment
+
+    (new_score, comment), res = watched_transaction(ckey, apply, key)
+    count_str, sum_str = res[-2], res[-1]
+
+    count = int(count_str or 0)
+    sum_ = int(sum_str or 0)
+
+    avg = (sum_ / count) if count > 0 else 0.0
+
+    # Atualiza leaderboard
+    pipe = redis.pipeline(transaction=False)
+    update_leaderboard(pipe, {movie_id: avg})
+    mark_dirty(pipe, movie_id)
+    pipe.execute()
+
+    movie_name = fetch_movie_name(movie_id)
+
+    return {
+        "movie_name": movie_name,
+        "movie_id": movie_id,
+        "user_id": user_id,
+        "score": new_score,
+        "comment": comment,
+        "average": avg,
+        "count": count,
+    }
+
+def remove_rating(movie_id: str, user_id: str) -> tuple[int, int] | None:
+    """
+    Remove o rating e desconta dos agregados numa transação, com WATCH no
+    rating. Devolve (count, sum) novos do filme, ou None se não existia.
+    """
+    key = rating_key(movie_id, user_id)
+    ckey = count_key(movie_id)
+    skey = sum_key(movie_id)
+
+    def apply(pipe):
+        # Busca rating existente
+        data = pipe.hgetall(key)
+        pipe.multi()
+        if not data:
+            return None
+
+        try:
+            prev_score = int(data.get("score", 0))
+        except ValueError:
+            prev_score = 0
+        prev_ts_str = data.get("time_stamp") or data.get("ts")
+        prev_ts = int(prev_ts_str) if prev_ts_str else None
+
+        pipe.delete(key)
+        pipe.decr(ckey)
+        pipe.decrby(skey, prev_score)
+        queue_score_change(pipe, movie_id, prev_score, prev_ts)
+        pipe.get(ckey)
+        pipe.get(skey)
+        return data
+
+    data, res = watched_transaction(ckey, apply, key)
+    if not data:
+        return None
+    return int(res[-2] or 0), int(res[-1] or 0)
+
+# DELETA UM RATING DE UM USUÁRIO PARA UM FILME
+@router.delete("/ratings/{movie_id}/{user_id}", status_code=200)
+def delete_rating(movie_id: str, user_id: str):
+    removed = remove_rating(movie_id, user_id)
+    if removed is None:
+        raise HTTPException(status_code=404, detail="Rating não encontrado.")
+    new_count, new_sum = removed
+
+    # Recalcula média
+    new_avg = (new_sum / new_count) if new_count > 0 else 0.0
+
+    # Atualiza leaderboard
+    pipe = redis.pipeline(transaction=False)
+    update_leaderboard(pipe, {movie_id: new_avg})
+    mark_dirty(pipe, movie_id)
+    pipe.execute()
+
+    movie_name = fetch_movie_name(movie_id)
+
+    return {
+        "message": "Rating removido com sucesso.",
+        "movie_id": movie_id,
+        "movie_name": movie_name,
+        "user_id": user_id,
+        "new_count": new_count,
+        "new_sum": new_sum,
+        "new_average": new_avg,
+    }
+
+# DELETA TODOS OS RATINGS DE UM FILME
+@router.delete("/ratings/movie/{movie_id}", status_code=200)
+def delete_all_ratings_for_movie(movie_id: str):
+    keys = list(redis.scan_iter(match=rating_key(movie_id, "*"), count=1000))
+
+    deleted = 0
+    total_removed_score = 0
+
+    for key in keys:
+        data = redis.hgetall(key)
+        if data:
+            try:
+                total_removed_score += int(data.get("score", 0))
+            except ValueError:
+                pass
+        redis.delete(key)
+        deleted += 1
+
+    # zera agregados
+    ckey = count_key(movie_id)
+    skey = sum_key(movie_id)
+    redis.set(ckey, 0)
+    redis.set(skey, 0)
+
+    # histograma e buckets de tendência
+    redis.delete(histogram_key(movie_id))
+    for key in redis.scan_iter(match=trend_key(movie_id, "*", "*")):
+        redis.delete(key)
+
+    redis.incr(version_key(movie_id))
+
+    # média agora é 0; o próximo job de similaridade remove este filme das
+    # listas de vizinhos
+    pipe = redis.pipeline(transaction=False)
+    update_leaderboard(pipe, {movie_id: 0.0})
+    mark_dirty(pipe, movie_id)
+    pipe.execute()
+
+    movie_name = fetch_movie_name(movie_id)
+
+    return {
+        "message": "Todos os ratings deste filme foram removidos.",
+        "movie_id": movie_id,
+        "movie_name": movie_name,
+        "removed_ratings": deleted,
+        "removed_score_sum": total_removed_score,
+        "new_count": 0,
+        "new_sum": 0,
+        "new_avg": 0.0,
+    }
+
+# DELETA TODOS OS RATINGS DE UM USUÁRIO
+@router.delete("/ratings/user/{user_id}", status_code=200)
+def delete_all_ratings_from_user(user_id: str):
+
+    keys = list(redis.scan_iter(match=rating_key("*", user_id), count=1000))
+
+    affected_movies = {}
+
+    for key in keys:
+        movie_id = key_movie_id(key)
+
+        # remover rating e atualizar agregados do filme
+        removed = remove_rating(movie_id, user_id)
+        if removed is None:
+            # removido por outra request depois do SCAN
+            continue
+        new_count, new_sum = removed
+        new_avg = (new_sum / new_count) if new_count > 0 else 0.0
+
+        # atualizar leaderboard
+        pipe = redis.pipeline(transaction=False)
+        update_leaderboard(pipe, {movie_id: new_avg})
+        mark_dirty(pipe, movie_id)
+        pipe.execute()
+
+        affected_movies[movie_id] = {
+            "new_count": new_count,
+            "new_sum": new_sum,
+            "new_avg": new_avg,
+        }
+
+    return {
+        "message": "Todos os ratings do usuário foram removidos.",
+        "user_id": user_id,
+        "affected_movies": affected_movies,
+    }
+
+# DELETA TODAS AS RATINGS
+@router.delete("/ratings/all", status_code=200)
+def delete_all_ratings():
+    # apaga ratings, agregados, leaderboard
+    for key in redis.scan_iter(match="rating:*", count=1000):
+        redis.delete(key)
+
+    for key in redis.scan_iter(match="movie:*:rating_*", count=1000):
+        if key.endswith(":rating_version"):
+            # versões só crescem, para um ETag antigo nunca voltar a valer
+            redis.incr(key)
+        else:
+            redis.delete(key)
+
+    for key in leaderboard_keys():
+        redis.delete(key)
+    redis.delete(SIMILARITY_DIRTY_KEY)
+    redis.delete(SUMMARY_DIRTY_KEY)
+
+    # descarta ratings ainda não aplicados pelo worker (mantém o consumer group)
+    redis.xtrim(STREAM_KEY, maxlen=0)
+
+    return {"ok": True, "deleted": "all ratings"}
+
+
 api.include_router(router)
\ No newline at end of file
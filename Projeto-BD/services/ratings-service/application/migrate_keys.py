@@ -0,0 +1,173 @@
+"""
+Migra as chaves do layout antigo (sem hash tag) para o layout por filme:
+
+  rating:movie:{m}:user:{u}  ->  rating:{m}:user:{u}
+  movie:{m}:rating_*         ->  movie:{m}:rating_*   (m entre chaves, hash tag)
+  ratings:similarity:dirty   ->  ratings:{similarity}:dirty
+  top:avg_ratings            ->  partições top:avg_ratings:{lbN}, recalculadas
+  rating_hist/rating_trend   ->  recalculados a partir dos hashes de rating
+
+Roda com o Redis ainda em nó único (RENAME não cruza slots) e os serviços
+parados; depois os dados podem ser importados no cluster
+(redis-cli --cluster import). Com --leaderboard-only só recalcula as
+partições do leaderboard, o que também funciona no cluster, por exemplo
+depois de mudar RATINGS_LEADERBOARD_PARTITIONS. Com --histograms-only só
+recalcula histogramas e buckets de tendência (ratings gravados antes deles
+existirem não estão contados neles; sem o recálculo, uma troca ou remoção
+desses ratings desconta de um bucket vazio).
+
+Uso: python -m application.migrate_keys [--leaderboard-only | --histograms-only]
+"""
+import argparse, time
+from collections import Counter
+from .db import (
+    redis, rating_key, count_key, sum_key, key_movie_id,
+    LEADERBOARD_KEY, leaderboard_keys, update_leaderboard,
+)
+from .aggregates import (
+    SIMILARITY_DIRTY_KEY, TREND_GRANULARITIES, histogram_key, trend_key, bucket_start,
+)
+
+SCAN_BATCH = 1000
+LEGACY_SIMILARITY_DIRTY_KEY = "ratings:similarity:dirty"
+
+
+def new_name(key: str) -> str | None:
+    parts = key.split(":")
+    if key.startswith("rating:movie:") and len(parts) == 5 and parts[3] == "user":
+        # rating:movie:{m}:user:{u}
+        return rating_key(parts[2], parts[4])
+    if key.startswith("movie:") and not parts[1].startswith("{") and len(parts) >= 3:
+        # movie:{m}:rating_count, movie:{m}:rating_trend:day:..., etc.
+        return f"movie:{{{parts[1]}}}:" + ":".join(parts[2:])
+    return None
+
+
+def migrate_keys() -> dict:
+    renamed = conflicts = 0
+    for pattern in ("rating:movie:*:user:*", "movie:*:rating_*"):
+        for key in list(redis.scan_iter(match=pattern, count=SCAN_BATCH)):
+            target = new_name(key)
+            if target is None:
+                continue
+            # RENAMENX preserva TTL (buckets de tendência) e não sobrescreve
+            # chaves já gravadas no layout novo
+            if redis.renamenx(key, target):
+                renamed += 1
+            else:
+                conflicts += 1
+                print("migrate_keys: chave já existe no layout novo, mantida:", key, "->", target)
+
+    for suffix in ("", ":processing"):
+        legacy = LEGACY_SIMILARITY_DIRTY_KEY + suffix
+        if redis.exists(legacy):
+            target = SIMILARITY_DIRTY_KEY + suffix
+            redis.sunionstore(target, [target, legacy])
+            redis.delete(legacy)
+            renamed += 1
+
+    return {"renamed": renamed, "conflicts": conflicts}
+
+
+def rebuild_leaderboard() -> int:
+    """Recalcula as partições do leaderboard a partir de rating_count/rating_sum."""
+    for key in [LEADERBOARD_KEY, *leaderboard_keys()]:
+        redis.delete(key)
+    for key in redis.scan_iter(match=f"{LEADERBOARD_KEY}:*", count=SCAN_BATCH):
+        # partições de uma configuração anterior com mais partições
+        redis.delete(key)
+
+    movies = 0
+    batch = []
+    def flush():
+        pipe = redis.pipeline(transaction=False)
+        for movie_id in batch:
+            pipe.mget(count_key(movie_id), sum_key(movie_id))
+        averages = {}
+        for movie_id, (count_str, sum_str) in zip(batch, pipe.execute()):
+            count = int(count_str or 0)
+            averages[movie_id] = (int(sum_str or 0) / count) if count > 0 else 0.0
+        pipe = redis.pipeline(transaction=False)
+        update_leaderboard(pipe, averages)
+        pipe.execute()
+        batch.clear()
+
+    for key in redis.scan_iter(match=count_key("*"), count=SCAN_BATCH):
+        batch.append(key_movie_id(key))
+        movies += 1
+        if len(batch) >= SCAN_BATCH:
+            flush()
+    if batch:
+        flush()
+    return movies
+
+
+def rebuild_histograms() -> int:
+    """
+    Recalcula rating_hist e os buckets de rating_trend de cada filme a partir
+    dos hashes de rating (buckets já fora da retenção não são recriados).
+    """
+    histograms: dict[str, Counter] = {}
+    trends: dict[tuple[str, str, int], list[int]] = {}  # (filme, granularidade, bucket) -> [count, sum]
+    now = int(time.time())
+
+    keys = []
+    def read():
+        pipe = redis.pipeline(transaction=False)
+        for key in keys:
+            pipe.hmget(key, "score", "time_stamp", "ts")
+        for key, (score_str, ts_str, legacy_ts_str) in zip(keys, pipe.execute()):
+            if score_str is None:
+                continue
+            movie_id, score = key_movie_id(key), int(score_str)
+            histograms.setdefault(movie_id, Counter())[str(score)] += 1
+            ts_str = ts_str or legacy_ts_str
+            if not ts_str:
+                continue
+            for granularity, (size, retention) in TREND_GRANULARITIES.items():
+                if int(ts_str) > now - retention:
+                    bucket = trends.setdefault((movie_id, granularity, bucket_start(int(ts_str), size)), [0, 0])
+                    bucket[0] += 1
+                    bucket[1] += score
+        keys.clear()
+
+    for key in redis.scan_iter(match=rating_key("*", "*"), count=SCAN_BATCH):
+        keys.append(key)
+        if len(keys) >= SCAN_BATCH:
+            read()
+    if keys:
+        read()
+
+    for pattern in (histogram_key("*"), trend_key("*", "*", "*")):
+        for key in redis.scan_iter(match=pattern, count=SCAN_BATCH):
+            redis.delete(key)
+
+    pipe = redis.pipeline(transaction=False)
+    for movie_id, histogram in histograms.items():
+        pipe.hset(histogram_key(movie_id), mapping=histogram)
+        if len(pipe) >= SCAN_BATCH:
+            pipe.execute()
+    for (movie_id, granularity, bucket), (count, sum_) in trends.items():
+        size, retention = TREND_GRANULARITIES[granularity]
+        key = trend_key(movie_id, granularity, bucket)
+        pipe.hset(key, mapping={"count": count, "sum": sum_})
+        pipe.expireat(key, bucket + size + retention)
+        if len(pipe) >= SCAN_BATCH:
+            pipe.execute()
+    pipe.execute()
+    return len(histograms)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migra as chaves de ratings para o layout com hash tags")
+    only = parser.add_mutually_exclusive_group()
+    only.add_argument("--leaderboard-only", action="store_true", help="só recalcula as partições do leaderboard")
+    only.add_argument("--histograms-only", action="store_true", help="só recalcula histogramas e tendência")
+    args = parser.parse_args()
+
+    if not (args.leaderboard_only or args.histograms_only):
+        print("migrate_keys:", migrate_keys())
+    if not args.histograms_only:
+        print("migrate_keys: leaderboard recalculado para", rebuild_leaderboard(), "filmes")
+    if not args.leaderboard_only:
+        print("migrate_keys: histograma e tendência recalculados para", rebuild_histograms(), "filmes")
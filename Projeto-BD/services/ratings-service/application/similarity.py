@@ -0,0 +1,211 @@
+"""
+Job offline de similaridade item-item.
+
+Lê todos os ratings do Redis para uma matriz esparsa filmes x usuários,
+calcula os K vizinhos mais similares de cada filme (cosseno ou cosseno
+ajustado pela média do usuário) em blocos de linhas e grava as listas em
+sorted sets `movie:{id}:rating_similar` (id na hash tag).
+
+Sem --full, recalcula apenas os filmes marcados em `ratings:similarity:dirty`
+(preenchido a cada escrita de rating) e atualiza a posição desses filmes nas
+listas dos seus vizinhos: entra (ou tem a similaridade trocada) na lista de
+cada vizinho novo e sai da lista de cada vizinho antigo que deixou de ser
+vizinho. O incremental não corrige tudo: uma lista que contém o filme sem
+ele tê-la entre os seus vizinhos (a relação de top-K não é simétrica) e, no
+cosseno ajustado, filmes não marcados cujas similaridades mudaram porque um
+rating novo deslocou a média do usuário. Com --interval, --full-every N
+refaz o cálculo completo a cada N execuções para limpar essas entradas.
+
+Uso: python -m application.similarity [--full] [--metric adjusted] [--k 20]
+         [--interval 600 --full-every 12]
+"""
+import argparse, os, time
+import numpy as np
+from scipy import sparse
+from .db import redis, transaction, rating_key, key_movie_id, key_user_id
+from .aggregates import SIMILARITY_DIRTY_KEY, similar_key
+
+SIMILARITY_K = int(os.getenv("RATINGS_SIMILARITY_K", "20"))
+SIMILARITY_METRIC = os.getenv("RATINGS_SIMILARITY_METRIC", "adjusted")
+# Linhas (filmes) por bloco na multiplicação; controla o pico de memória
+SIMILARITY_CHUNK = int(os.getenv("RATINGS_SIMILARITY_CHUNK", "512"))
+# Execuções entre dois --full no modo --interval (0 = só incremental)
+SIMILARITY_FULL_EVERY = int(os.getenv("RATINGS_SIMILARITY_FULL_EVERY", "0"))
+SCAN_BATCH = 1000
+
+LAST_RUN_KEY = "ratings:similarity:last_run"
+
+
+def load_ratings():
+    """
+    Varre `rating:{*}:user:*` em lotes (SCAN + pipeline de HGET) e
+    devolve a matriz CSR filmes x usuários e a lista de movie_ids por linha.
+    """
+    movie_index, user_index = {}, {}
+    rows, cols, vals = [], [], []
+
+    batch = []
+    def flush():
+        pipe = redis.pipeline(transaction=False)
+        for key in batch:
+            pipe.hget(key, "score")
+        for key, score in zip(batch, pipe.execute()):
+            if score is None:
+                continue
+            movie_id, user_id = key_movie_id(key), key_user_id(key)
+            rows.append(movie_index.setdefault(movie_id, len(movie_index)))
+            cols.append(user_index.setdefault(user_id, len(user_index)))
+            vals.append(float(score))
+        batch.clear()
+
+    for key in redis.scan_iter(match=rating_key("*", "*"), count=SCAN_BATCH):
+        batch.append(key)
+        if len(batch) >= SCAN_BATCH:
+            flush()
+    if batch:
+        flush()
+
+    matrix = sparse.csr_matrix(
+        (np.asarray(vals, dtype=np.float32),
+         (np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64))),
+        shape=(len(movie_index), len(user_index)),
+    )
+    return matrix, list(movie_index)
+
+
+def normalize(matrix: sparse.csr_matrix, metric: str) -> sparse.csr_matrix:
+    m = matrix.tocsc(copy=True)
+    if metric == "adjusted":
+        # Cosseno ajustado: subtrai a média de cada usuário das suas notas
+        counts = np.diff(m.indptr)
+        sums = np.asarray(m.sum(axis=0)).ravel()
+        means = np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
+        m.data -= np.repeat(means, counts).astype(m.dtype)
+    m = m.tocsr()
+
+    norms = np.sqrt(np.asarray(m.multiply(m).sum(axis=1)).ravel())
+    inv = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    return (sparse.diags(inv.astype(np.float32)) @ m).tocsr()
+
+
+def top_k_neighbours(x: sparse.csr_matrix, row_ids: list[int], k: int):
+    """
+    Gera (linha, [(vizinho, similaridade), ...]) para as linhas pedidas,
+    multiplicando um bloco de SIMILARITY_CHUNK linhas por vez.
+    """
+    xt = x.T.tocsc()
+    for start in range(0, len(row_ids), SIMILARITY_CHUNK):
+        block = row_ids[start:start + SIMILARITY_CHUNK]
+        sims = (x[block] @ xt).tocsr()
+
+        for i, row in enumerate(block):
+            lo, hi = sims.indptr[i], sims.indptr[i + 1]
+            idx, val = sims.indices[lo:hi], sims.data[lo:hi]
+            keep = (idx != row) & (val > 0)
+            idx, val = idx[keep], val[keep]
+            if len(val) > k:
+                part = np.argpartition(-val, k)[:k]
+                idx, val = idx[part], val[part]
+            yield row, list(zip(idx.tolist(), val.tolist()))
+
+
+def run(full: bool = False, metric: str = SIMILARITY_METRIC, k: int = SIMILARITY_K) -> dict:
+    started = time.perf_counter()
+
+    # Renomeia o conjunto de pendentes para não perder marcações feitas durante o job
+    processing_key = f"{SIMILARITY_DIRTY_KEY}:processing"
+    # (e soma o que sobrou de uma execução interrompida); mesma hash tag
+    pipe = transaction(SIMILARITY_DIRTY_KEY)
+    pipe.sunionstore(processing_key, [processing_key, SIMILARITY_DIRTY_KEY])
+    pipe.delete(SIMILARITY_DIRTY_KEY)
+    pipe.execute()
+    dirty = redis.smembers(processing_key)
+
+    matrix, movie_ids = load_ratings()
+    index = {movie_id: i for i, movie_id in enumerate(movie_ids)}
+
+    if full:
+        rows = list(range(len(movie_ids)))
+        stale = {
+            key_movie_id(key) for key in redis.scan_iter(match=similar_key("*"), count=SCAN_BATCH)
+        } - index.keys()
+    else:
+        rows = [index[m] for m in dirty if m in index]
+        stale = dirty - index.keys()
+
+    pipe = redis.pipeline(transaction=False)
+    # Filmes sem nenhum rating restante deixam de ter vizinhos e, pela
+    # simetria, saem das listas dos filmes que eram seus vizinhos
+    for movie_id in stale:
+        for other in redis.zrange(similar_key(movie_id), 0, -1):
+            pipe.zrem(similar_key(other), movie_id)
+        pipe.delete(similar_key(movie_id))
+
+    previous = {}
+    if not full and rows:
+        # Vizinhos atuais de cada filme recalculado, para tirá-lo das listas
+        # de quem deixar de ser vizinho
+        read = redis.pipeline(transaction=False)
+        for row in rows:
+            read.zrange(similar_key(movie_ids[row]), 0, -1)
+        previous = dict(zip(rows, read.execute()))
+
+    x = normalize(matrix, metric) if rows else None
+    for row, neighbours in (top_k_neighbours(x, rows, k) if rows else []):
+        movie_id = movie_ids[row]
+        key = similar_key(movie_id)
+        pipe.delete(key)
+        if neighbours:
+            pipe.zadd(key, {movie_ids[j]: sim for j, sim in neighbours})
+
+        if not full:
+            # Similaridade é simétrica: atualiza este filme na lista dos vizinhos
+            for j, sim in neighbours:
+                other = similar_key(movie_ids[j])
+                pipe.zadd(other, {movie_id: sim})
+                pipe.zremrangebyrank(other, 0, -(k + 1))
+            for other in set(previous[row]) - {movie_ids[j] for j, _ in neighbours}:
+                pipe.zrem(similar_key(other), movie_id)
+
+        if len(pipe) >= SCAN_BATCH:
+            pipe.execute()
+
+    pipe.hset(LAST_RUN_KEY, mapping={
+        "ts": int(time.time()),
+        "mode": "full" if full else "incremental",
+        "metric": metric,
+        "k": k,
+        "movies": len(movie_ids),
+        "recomputed": len(rows),
+    })
+    pipe.delete(processing_key)
+    pipe.execute()
+
+    return {
+        "mode": "full" if full else "incremental",
+        "movies": len(movie_ids),
+        "users": matrix.shape[1],
+        "ratings": matrix.nnz,
+        "recomputed": len(rows),
+        "elapsed_s": round(time.perf_counter() - started, 3),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Similaridade item-item a partir dos ratings")
+    parser.add_argument("--full", action="store_true", help="recalcula todos os filmes")
+    parser.add_argument("--metric", choices=["cosine", "adjusted"], default=SIMILARITY_METRIC)
+    parser.add_argument("--k", type=int, default=SIMILARITY_K)
+    parser.add_argument("--interval", type=int, default=0,
+                        help="segundos entre execuções incrementais (0 = executa uma vez)")
+    parser.add_argument("--full-every", type=int, default=SIMILARITY_FULL_EVERY,
+                        help="com --interval, a cada N execuções uma é completa (0 = nunca)")
+    args = parser.parse_args()
+
+    print("ratings-similarity:", run(full=args.full, metric=args.metric, k=args.k))
+    runs = 0
+    while args.interval > 0:
+        time.sleep(args.interval)
+        runs += 1
+        full = args.full_every > 0 and runs % args.full_every == 0
+        print("ratings-similarity:", run(full=full, metric=args.metric, k=args.k))
@@ -0,0 +1,89 @@
+import os, time
+from redis.exceptions import ResponseError
+from .db import redis
+
+# Modo write-behind: POST /ratings só anexa o evento ao stream e o worker
+# (application.worker) aplica hash, agregados e leaderboard em lotes.
+WRITE_BEHIND = os.getenv("RATINGS_WRITE_BEHIND", "0") == "1"
+
+STREAM_KEY = os.getenv("RATINGS_STREAM_KEY", "ratings:stream")
+STREAM_GROUP = os.getenv("RATINGS_STREAM_GROUP", "ratings-aggregator")
+# Tamanho aproximado máximo do stream (XADD MAXLEN ~)
+STREAM_MAXLEN = int(os.getenv("RATINGS_STREAM_MAXLEN", "1000000"))
+# Acima desse lag (entradas ainda não aplicadas) o endpoint recusa com 503
+STREAM_MAX_LAG = int(os.getenv("RATINGS_STREAM_MAX_LAG", "100000"))
+STREAM_RETRY_AFTER = int(os.getenv("RATINGS_STREAM_RETRY_AFTER", "1"))
+
+
+def ensure_group():
+    try:
+        redis.xgroup_create(STREAM_KEY, STREAM_GROUP, id="0", mkstream=True)
+    except ResponseError as err:
+        # BUSYGROUP: o grupo já existe
+        if "BUSYGROUP" not in str(err):
+            raise
+
+
+def enqueue_rating(movie_id: str, user_id: str, score: int, comment: str | None) -> str:
+    fields = {
+        "movie_id": movie_id,
+        "user_id": user_id,
+        "score": int(score),
+        "comment": comment or "",
+        "time_stamp": int(time.time()),
+    }
+    return redis.xadd(STREAM_KEY, fields, maxlen=STREAM_MAXLEN, approximate=True)
+
+
+def stream_lag() -> int:
+    """
+    Entradas do stream que ainda não foram aplicadas: as nunca entregues ao
+    grupo (lag) mais as entregues e ainda não confirmadas (pending).
+    """
+    try:
+        groups = redis.xinfo_groups(STREAM_KEY)
+    except ResponseError:
+        return 0
+
+    for g in groups:
+        if g.get("name") != STREAM_GROUP:
+            continue
+        lag = g.get("lag")
+        if lag is None:
+            # Redis < 7 não informa lag; usa o comprimento do stream como teto
+            lag = redis.xlen(STREAM_KEY)
+        return int(lag) + int(g.get("pending") or 0)
+
+    return redis.xlen(STREAM_KEY)
+
+
+_lag_cache = {"ts": 0.0, "lag": 0}
+
+def lag_exceeded() -> bool:
+    # Evita um XINFO por request: o lag é reavaliado no máximo a cada 0.5s
+    now = time.monotonic()
+    if now - _lag_cache["ts"] > 0.5:
+        _lag_cache["lag"] = stream_lag()
+        _lag_cache["ts"] = now
+    return _lag_cache["lag"] >= STREAM_MAX_LAG
+
+
+def stream_stats() -> dict:
+    try:
+        length = redis.xlen(STREAM_KEY)
+        groups = redis.xinfo_groups(STREAM_KEY)
+    except ResponseError:
+        length, groups = 0, []
+
+    group = next((g for g in groups if g.get("name") == STREAM_GROUP), None)
+    return {
+        "write_behind": WRITE_BEHIND,
+        "stream": STREAM_KEY,
+        "group": STREAM_GROUP,
+        "length": length,
+        "consumers": int(group.get("consumers") or 0) if group else 0,
+        "pending": int(group.get("pending") or 0) if group else 0,
+        "lag": stream_lag(),
+        "max_lag": STREAM_MAX_LAG,
+        "last_delivered_id": group.get("last-delivered-id") if group else None,
+    }
@@ -0,0 +1,82 @@
+"""
+Sincroniza o resumo de ratings (count e média) para os documentos de filme
+no movies-service.
+
+Cada escrita de rating marca o filme em `ratings:summary:dirty`. A cada
+RATINGS_SUMMARY_INTERVAL segundos este processo esvazia o conjunto em lotes
+e envia um único PUT /movies/rating-summary por lote, então várias notas do
+mesmo filme no intervalo viram uma só atualização no Mongo.
+
+Uso: python -m application.summary_sync [--backfill]
+"""
+import argparse, os, time, requests
+from .db import redis, count_key, sum_key, key_movie_id
+from .aggregates import SUMMARY_DIRTY_KEY
+
+MOVIES_URL = os.getenv("MOVIES_URL", "http://movies-service:8000")
+SUMMARY_INTERVAL = float(os.getenv("RATINGS_SUMMARY_INTERVAL", "2"))
+SUMMARY_BATCH = int(os.getenv("RATINGS_SUMMARY_BATCH", "500"))
+
+
+def sync_batch(movie_ids: list[str]) -> bool:
+    pipe = redis.pipeline(transaction=False)
+    for movie_id in movie_ids:
+        pipe.mget(count_key(movie_id), sum_key(movie_id))
+
+    items = []
+    for movie_id, (count_str, sum_str) in zip(movie_ids, pipe.execute()):
+        count = max(int(count_str or 0), 0)
+        sum_ = int(sum_str or 0)
+        items.append({
+            "movie_id": movie_id,
+            "count": count,
+            "average": (sum_ / count) if count > 0 else 0.0,
+        })
+
+    try:
+        resp = requests.put(f"{MOVIES_URL}/movies/rating-summary", json=items, timeout=10)
+        return resp.status_code == 200
+    except Exception as err:
+        print("Erro ao enviar resumo de ratings ao movies-service:", err)
+        return False
+
+
+def sync_pending() -> int:
+    synced = 0
+    while True:
+        movie_ids = redis.spop(SUMMARY_DIRTY_KEY, SUMMARY_BATCH)
+        if not movie_ids:
+            return synced
+        if not sync_batch(movie_ids):
+            # devolve para a próxima rodada
+            redis.sadd(SUMMARY_DIRTY_KEY, *movie_ids)
+            return synced
+        synced += len(movie_ids)
+
+
+def mark_all():
+    # Marca todos os filmes com agregados, para a primeira carga do resumo
+    pipe = redis.pipeline(transaction=False)
+    for key in redis.scan_iter(match=count_key("*"), count=1000):
+        pipe.sadd(SUMMARY_DIRTY_KEY, key_movie_id(key))
+    pipe.execute()
+
+
+def run():
+    print(f"ratings-summary-sync: enviando para {MOVIES_URL} a cada {SUMMARY_INTERVAL}s")
+    while True:
+        started = time.monotonic()
+        synced = sync_pending()
+        if synced:
+            print(f"ratings-summary-sync: {synced} filmes atualizados")
+        time.sleep(max(0.0, SUMMARY_INTERVAL - (time.monotonic() - started)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sincroniza o resumo de ratings com o movies-service")
+    parser.add_argument("--backfill", action="store_true", help="envia o resumo de todos os filmes na subida")
+    args = parser.parse_args()
+
+    if args.backfill:
+        mark_all()
+    run()
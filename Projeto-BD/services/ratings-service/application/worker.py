@@ -0,0 +1,184 @@
+"""
+Worker do modo write-behind.
+
+Consome o stream de ratings (consumer group) e aplica em lotes as
+atualizações de hash, agregados (count/sum) e leaderboard.
+
+Uso: python -m application.worker
+"""
+import os, socket, time
+from .db import redis, watched_transaction, slot_group, rating_key, count_key, sum_key, update_leaderboard
+from .aggregates import queue_score_change, mark_dirty
+from .stream import STREAM_KEY, STREAM_GROUP, ensure_group
+
+BATCH_SIZE = int(os.getenv("RATINGS_STREAM_BATCH", "500"))
+BLOCK_MS = int(os.getenv("RATINGS_STREAM_BLOCK_MS", "1000"))
+# Entradas pendentes há mais que isso em outro consumer são reivindicadas
+CLAIM_IDLE_MS = int(os.getenv("RATINGS_STREAM_CLAIM_IDLE_MS", "60000"))
+CONSUMER = os.getenv("RATINGS_STREAM_CONSUMER", f"{socket.gethostname()}-{os.getpid()}")
+
+
+def stream_id(entry_id: str | None) -> tuple[int, int]:
+    # "1718000000000-3" -> (1718000000000, 3), comparável em ordem do stream
+    if not entry_id:
+        return (0, 0)
+    ms, _, seq = entry_id.partition("-")
+    return (int(ms), int(seq or 0))
+
+
+def apply_group(entries: list[tuple[str, dict]]) -> dict[str, float]:
+    """
+    Aplica numa transação as entradas cujos filmes caem no mesmo slot e
+    devolve a média nova de cada filme. Ratings repetidos para o mesmo
+    (filme, usuário) dentro do lote são resolvidos em memória, então cada
+    chave é lida e escrita uma única vez. Histograma e tendência recebem
+    cada troca de score na ordem do stream.
+
+    Os hashes dos ratings ficam sob WATCH enquanto são lidos: se uma escrita
+    síncrona (PUT/DELETE) mexer em algum deles antes do EXEC, o grupo é
+    relido e reaplicado sobre os valores atuais.
+    """
+    keys = list(dict.fromkeys(rating_key(f["movie_id"], f["user_id"]) for _, f in entries))
+
+    def apply(write):
+        # Leitura por um pipeline comum, numa ida só; o WATCH já está ativo,
+        # então qualquer mudança depois dele derruba o EXEC
+        pipe = redis.pipeline(transaction=False)
+        for key in keys:
+            pipe.hmget(key, "score", "time_stamp", "stream_id")
+        current, applied = {}, {}
+        for key, (s, ts, sid) in zip(keys, pipe.execute()):
+            current[key] = (int(s), int(ts) if ts else None) if s is not None else (None, None)
+            applied[key] = stream_id(sid)
+
+        write.multi()
+        final = {}
+        deltas = {}  # movie_id -> [delta_count, delta_sum]
+        for entry_id, f in entries:
+            movie_id, score = f["movie_id"], int(f["score"])
+            ts = int(f.get("time_stamp") or time.time())
+            key = rating_key(movie_id, f["user_id"])
+            if stream_id(entry_id) <= applied[key]:
+                continue  # já aplicada antes de uma queda do worker
+            prev, prev_ts = current[key]
+
+            d = deltas.setdefault(movie_id, [0, 0])
+            if prev is None:
+                d[0] += 1
+                d[1] += score
+            else:
+                d[1] += score - prev
+            queue_score_change(write, movie_id, prev, prev_ts, score, ts)
+            current[key] = (score, ts)
+
+            final[key] = {
+                "score": score,
+                "comment": f.get("comment", ""),
+                "time_stamp": ts,
+                "stream_id": entry_id,
+            }
+
+        for key, mapping in final.items():
+            write.hset(key, mapping=mapping)
+        offsets = {}
+        for movie_id, (dc, ds) in deltas.items():
+            offsets[movie_id] = len(write)
+            write.incrby(count_key(movie_id), dc)
+            write.incrby(sum_key(movie_id), ds)
+        return offsets
+
+    offsets, res = watched_transaction(count_key(entries[0][1]["movie_id"]), apply, *keys)
+
+    averages = {}
+    for movie_id, offset in offsets.items():
+        count, sum_ = int(res[offset] or 0), int(res[offset + 1] or 0)
+        averages[movie_id] = (sum_ / count) if count > 0 else 0.0
+    return averages
+
+
+def apply_batch(entries: list[tuple[str, dict]]) -> int:
+    """
+    Aplica um lote de entradas do stream, uma transação por slot (num Redis
+    único, o lote todo numa transação só; ver apply_group). O hash do rating
+    guarda o id da última entrada aplicada (`stream_id`): se o worker cair
+    depois das transações e antes do XACK, a entrada reentregue é
+    reconhecida e ignorada.
+    """
+    if not entries:
+        return 0
+
+    groups = {}
+    for entry_id, f in entries:
+        groups.setdefault(slot_group(count_key(f["movie_id"])), []).append((entry_id, f))
+
+    averages = {}
+    for group in groups.values():
+        averages.update(apply_group(group))
+
+    # Leaderboard, marcações e XACK ficam em outros slots: depois das transações
+    pipe = redis.pipeline(transaction=False)
+    if averages:
+        update_leaderboard(pipe, averages)
+        mark_dirty(pipe, *averages)
+    pipe.xack(STREAM_KEY, STREAM_GROUP, *[entry_id for entry_id, _ in entries])
+    pipe.execute()
+    return len(entries)
+
+
+def live_entries(entries) -> list[tuple[str, dict]]:
+    # Entradas removidas do stream (XTRIM/reset) chegam sem campos: só confirma
+    gone = [entry_id for entry_id, fields in entries if not fields]
+    if gone:
+        redis.xack(STREAM_KEY, STREAM_GROUP, *gone)
+    return [(entry_id, fields) for entry_id, fields in entries if fields]
+
+
+def read_batch() -> list[tuple[str, dict]]:
+    res = redis.xreadgroup(
+        STREAM_GROUP, CONSUMER, {STREAM_KEY: ">"},
+        count=BATCH_SIZE, block=BLOCK_MS,
+    )
+    if not res:
+        return []
+    # res = [[stream, [(id, fields), ...]]]
+    return live_entries(res[0][1])
+
+
+def claim_stale() -> list[tuple[str, dict]]:
+    res = redis.xautoclaim(
+        STREAM_KEY, STREAM_GROUP, CONSUMER,
+        min_idle_time=CLAIM_IDLE_MS, start_id="0-0", count=BATCH_SIZE,
+    )
+    # res = [next_start_id, [(id, fields), ...], deleted_ids]
+    return live_entries(res[1])
+
+
+def run():
+    ensure_group()
+    print(f"ratings-worker {CONSUMER}: consumindo {STREAM_KEY} ({STREAM_GROUP})")
+
+    # Primeiro reprocessa o que ficou pendente para este consumer
+    while True:
+        res = redis.xreadgroup(STREAM_GROUP, CONSUMER, {STREAM_KEY: "0"}, count=BATCH_SIZE)
+        if not res or not res[0][1]:
+            break
+        apply_batch(live_entries(res[0][1]))
+
+    last_claim = 0.0
+    while True:
+        if time.monotonic() - last_claim > CLAIM_IDLE_MS / 1000:
+            apply_batch(claim_stale())
+            last_claim = time.monotonic()
+
+        entries = read_batch()
+        if not entries:
+            continue
+
+        started = time.perf_counter()
+        applied = apply_batch(entries)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        print(f"ratings-worker: {applied} ratings aplicados em {elapsed_ms:.1f}ms")
+
+
+if __name__ == "__main__":
+    run()
@@ -1,47 +1,149 @@
-import os, json, httpx
-from sqlalchemy.orm import Session
-from .models import S1Log
-
-USERS_URL   = os.getenv("USERS_URL", "http://users-service:8000")
-MOVIES_URL  = os.getenv("MOVIES_URL", "http://movies-service:8000")
-RATINGS_URL = os.getenv("RATINGS_URL", "http://ratings-service:8000")
-
-DEFAULT_TIMEOUT = httpx.Timeout(10.0)
-
-async def call_and_log(db: Session, service: str, method: str, url: str, json_body: dict | None):
-    async with httpx.AsyncClient(timeout=DEFAULT_TIMEOUT) as client:
-        try:
-            resp = await client.request(method, url, json=json_body)
-            status = resp.status_code
-            text = resp.text
-        except Exception as e:
-            status = 599
-            text = f"client_error: {type(e).__name__}: {e}"
-
-    log = S1Log(
-        service=service,
-        method=method,
-        url=url,
-        request_body=json.dumps(json_body or {}),
-        response_status=status,
-        response_body=text,
-    )
-    db.add(log)
-    db.commit()
-    return resp if isinstance(text, str) and status != 599 else None
-
-# Users
-async def create_user(db: Session, payload: dict):
-    return await call_and_log(db, "users-service", "POST", f"{USERS_URL}/users", payload)
-
-# Movies
-async def create_movie(db: Session, payload: dict):
-    return await call_and_log(db, "movies-service", "POST", f"{MOVIES_URL}/movies/", payload)
-
-# Reviews
-async def create_review(db: Session, payload: dict):
-    return await call_and_log(db, "movies-service", "POST", f"{MOVIES_URL}/reviews/", payload)
-
-# Ratings
-async def create_rating(db: Session, payload: dict):
-    return await call_and_log(db, "ratings-service", "POST", f"{RATINGS_URL}/ratings", payload)
\ No newline at end of file
+import asyncio, os, json
+from collections import Counter
+from sqlalchemy.orm import Session
+from .models import S1Log
+from .resilience import ServiceClient, CircuitOpenError, LoadShedError
+
+USERS_URL   = os.getenv("USERS_URL", "http://users-service:8000")
+MOVIES_URL  = os.getenv("MOVIES_URL", "http://movies-service:8000")
+RATINGS_URL = os.getenv("RATINGS_URL", "http://ratings-service:8000")
+
+# Um cliente por serviço S2, com política própria de timeout/retry/hedge/breaker
+CLIENTS = {
+    name: ServiceClient(name)
+    for name in ("users-service", "movies-service", "ratings-service")
+}
+
+def client_stats():
+    return {name: c.stats() for name, c in CLIENTS.items()}
+
+COUNTERS = ("calls", "failures", "retries", "hedges", "hedge_wins", "circuit_rejected")
+BREAKER_SEVERITY = {"closed": 0, "half_open": 1, "open": 2}
+
+def merge_client_stats(snapshots: list[dict]) -> dict:
+    """Junta o client_stats() de vários workers numa visão do container."""
+    merged = {}
+    for name in CLIENTS:
+        per = [s[name] for s in snapshots if name in s]
+        if not per:
+            continue
+        counters = {k: sum(p[k] for p in per) for k in COUNTERS}
+        states = Counter(p["breaker"]["state"] for p in per)
+        limiters = [p["limiter"] for p in per]
+        baselines = [l["baseline_ms"] for l in limiters if l["baseline_ms"] is not None]
+        merged[name] = {
+            **counters,
+            "hedge_win_rate": (counters["hedge_wins"] / counters["hedges"]) if counters["hedges"] else 0.0,
+            # percentis não se somam: reporta o pior worker
+            "p50_ms": max((p["p50_ms"] for p in per if p["p50_ms"] is not None), default=None),
+            "p95_ms": max((p["p95_ms"] for p in per if p["p95_ms"] is not None), default=None),
+            "breaker": {
+                "state": max(states, key=BREAKER_SEVERITY.get),
+                "workers": dict(states),
+                "consecutive_failures": max(p["breaker"]["consecutive_failures"] for p in per),
+            },
+            "limiter": {
+                "limit": round(sum(l["limit"] for l in limiters), 2),
+                "in_flight": sum(l["in_flight"] for l in limiters),
+                "queued": {prio: sum(l["queued"][prio] for l in limiters) for prio in limiters[0]["queued"]},
+                "shed": sum(l["shed"] for l in limiters),
+                "baseline_ms": min(baselines, default=None),
+            },
+        }
+    return merged
+
+BASE_URLS = {
+    "users-service": USERS_URL,
+    "movies-service": MOVIES_URL,
+    "ratings-service": RATINGS_URL,
+}
+WARM_CONNECTIONS = int(os.getenv("S1_WARM_CONNECTIONS", "4"))
+
+async def warm_clients():
+    # Abre conexões keep-alive com cada S2 antes do primeiro /run (fora das
+    # estatísticas e do breaker); um S2 ainda subindo não impede o resto
+    results = await asyncio.gather(*(
+        c.client.get(f"{BASE_URLS[name]}/healthz")
+        for name, c in CLIENTS.items() for _ in range(WARM_CONNECTIONS)
+    ), return_exceptions=True)
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors:
+        raise errors[0]
+
+async def close_clients():
+    for c in CLIENTS.values():
+        await c.aclose()
+
+async def call_and_log(db: Session, service: str, method: str, url: str, json_body: dict | None,
+                       priority: str = "interactive", idempotent: bool | None = None):
+    shed = None
+    try:
+        resp = await CLIENTS[service].request(method, url, json_body, priority, idempotent)
+        status = resp.status_code
+        text = resp.text
+    except LoadShedError as e:
+        # serviço saturado: registra e propaga para o endpoint responder 503
+        resp, shed = None, e
+        status = 503
+        text = f"load_shed: {e}"
+    except CircuitOpenError:
+        # breaker aberto: falha imediata, sem esperar o timeout
+        resp = None
+        status = 503
+        text = f"circuit_open: {service}"
+    except Exception as e:
+        resp = None
+        status = 599
+        text = f"client_error: {type(e).__name__}: {e}"
+
+    log = S1Log(
+        service=service,
+        method=method,
+        url=url,
+        request_body=json.dumps(json_body or {}),
+        response_status=status,
+        response_body=text,
+    )
+    db.add(log)
+    db.commit()
+    if shed is not None:
+        raise shed
+    return resp
+
+# Users
+async def create_user(db: Session, payload: dict):
+    return await call_and_log(db, "users-service", "POST", f"{USERS_URL}/users", payload, "bulk")
+
+# Movies
+async def create_movie(db: Session, payload: dict):
+    return await call_and_log(db, "movies-service", "POST", f"{MOVIES_URL}/movies/", payload, "bulk")
+
+# Reviews
+async def create_review(db: Session, payload: dict):
+    return await call_and_log(db, "movies-service", "POST", f"{MOVIES_URL}/reviews/", payload, "bulk")
+
+# Ratings
+async def create_rating(db: Session, payload: dict):
+    # POST /ratings é um upsert por (filme, usuário): repetir não duplica
+    return await call_and_log(db, "ratings-service", "POST", f"{RATINGS_URL}/ratings", payload, "bulk", idempotent=True)
+
+# Consultas interativas (sem registro em s1_logs): prioridade "interactive",
+# passam à frente das chamadas "bulk" do /run na fila de cada S2
+async def get_user(user_id: str):
+    return await CLIENTS["users-service"].request("GET", f"{USERS_URL}/users/{user_id}", None)
+
+async def get_movie(movie_id: str):
+    return await CLIENTS["movies-service"].request("GET", f"{MOVIES_URL}/movies/{movie_id}", None)
+
+async def get_movie_ratings(movie_id: str):
+    return await CLIENTS["ratings-service"].request("GET", f"{RATINGS_URL}/ratings/{movie_id}", None)
+
+# Reset: GET e DELETE passam pelos mesmos clientes (retry, hedge, breaker)
+async def list_users(limit: int = 100000):
+    return await CLIENTS["users-service"].request("GET", f"{USERS_URL}/users?limit={limit}", None, "bulk")
+
+async def delete_user(user_id: str):
+    return await CLIENTS["users-service"].request("DELETE", f"{USERS_URL}/users/{user_id}", None, "bulk")
+
+async def delete_all(service: str, path: str):
+    return await CLIENTS[service].request("DELETE", f"{BASE_URLS[service]}{path}", None, "bulk")
\ No newline at end of file
@@ -1,196 +1,287 @@
-from fastapi import FastAPI, HTTPException, Query
-from sqlalchemy.orm import Session
-from .models import Base, S1Log
-from .db import engine, SessionLocal
-from .seed import fake_user, fake_movie, fake_review, fake_rating
-from .clients import (
-    create_user, create_movie, create_review, create_rating
-)
-import requests
-import os
-
-api = FastAPI(title="s1-manager")
-
-@api.on_event("startup")
-def startup():
-    Base.metadata.create_all(bind=engine)
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-@api.post("/run")
-async def run_scenario(
-    users: int = Query(5, ge=0),
-    movies: int = Query(5, ge=0),
-    ratings: int = Query(10, ge=0),
-    reviews: int = Query(10, ge=0)
-):
-    """
-    Gera dados e chama S2:
-      - cria <users> usuários (users-service)
-      - cria <movies> filmes (movies-service /movies)
-      - cria <ratings> notas (ratings-service /ratings)
-      - cria <reviews> resenhas (movies-service /reviews)
-    Todas as requests/responses são logadas em s1_logs (Postgres).
-    """
-
-    db_ctx = get_db()
-    db: Session = next(db_ctx)
-
-    user_ids, movie_ids = [], []
-
-    # 1) Usuários
-    for _ in range(users):
-        resp = await create_user(db, fake_user())
-        if not resp or resp.status_code >= 400:
-            continue
-        try:
-            data = resp.json()
-            user_ids.append(data["id"])
-        except Exception:
-            continue
-
-    # 2) Filmes
-    for _ in range(movies):
-        resp = await create_movie(db, fake_movie())
-        if not resp or resp.status_code >= 400:
-            continue
-        try:
-            data = resp.json()
-            movie_ids.append(data["id"])
-        except Exception:
-            continue
-
-    if not user_ids or not movie_ids:
-        # encerra a sessão antes de retornar
-        try:
-            next(db_ctx)
-        except StopIteration:
-            pass
-        return {
-            "ok": False,
-            "users_created": len(user_ids),
-            "movies_created": len(movie_ids),
-            "ratings_created": 0,
-            "reviews_created": 0,
-            "message": "Nenhum usuário ou filme válido foi criado. "
-                    "Verifique se os S2 estão acessíveis e se os IDs retornados estão sendo extraídos corretamente."
-        }
-
-    total_users = len(user_ids)
-    total_movies = len(movie_ids)
-
-    # Ratings (Redis)
-    for i in range(ratings):
-        payload = fake_rating(user_ids[i % total_users], movie_ids[i % total_movies])
-        await create_rating(db, payload)
-
-    # Reviews (Mongo)
-    for i in range(reviews):
-        payload = fake_review(user_ids[i % total_users], movie_ids[i % total_movies])
-        await create_review(db, payload)
-
-    try:
-        next(db_ctx)
-    except StopIteration:
-        pass
-
-    return {
-        "ok": True,
-        "users_created": len(user_ids),
-        "movies_created": len(movie_ids),
-        "ratings_created": ratings,
-        "reviews_created": reviews
-    }
-
-@api.get("/logs")
-def logs(limit: int = 50):
-    with next(get_db()) as db:
-        rows = db.query(S1Log).order_by(S1Log.id.desc()).limit(limit).all()
-        return [
-            {
-                "id": l.id, "ts": str(l.ts), "service": l.service,
-                "method": l.method, "url": l.url,
-                "status": l.response_status
-            } for l in rows
-        ]
-    
-# DELETA OS DADOS DE TODOS OS BANCOS
-@api.delete("/reset", status_code=200)
-def reset_all():
-    """
-    Limpa TODOS os serviços usando chamadas HTTP.
-    """
-    result = {
-        "users_deleted": 0,
-        "movies_deleted": False,
-        "reviews_deleted": False,
-        "ratings_deleted": False,
-        "errors": []
-    }
-    
-    MOVIES_URL  = os.getenv("MOVIES_URL", "http://movies-service:8000")
-    USERS = os.getenv("USERS_URL", "http://users-service:8000")
-    MOVIES = MOVIES_URL + "/movies"
-    REVIEWS = MOVIES_URL + "/reviews"
-    RATINGS = os.getenv("RATINGS_URL", "http://ratings-service:8000")
-
-    # ----------------------
-    # 1) USERS-SERVICE
-    # ----------------------
-    try:
-        r = requests.get(f"{USERS}/users?limit=100000", timeout=5)
-        if r.status_code == 200:
-            users = r.json()
-            deleted = 0
-            for u in users:
-                uid = u.get("id")
-                if uid:
-                    dr = requests.delete(f"{USERS}/users/{uid}", timeout=5)
-                    if dr.status_code in (200, 204):
-                        deleted += 1
-            result["users_deleted"] = deleted
-        else:
-            result["errors"].append("GET /users failed")
-    except Exception as e:
-        result["errors"].append(f"users-service error: {e}")
-
-    # ----------------------
-    # 2) MOVIES-SERVICE
-    # ----------------------
-    try:
-        r = requests.delete(f"{MOVIES}/all", timeout=5)
-        if r.status_code == 200:
-            result["movies_deleted"] = True
-        else:
-            result["errors"].append("DELETE /movies/all failed")
-    except Exception as e:
-        result["errors"].append(f"movies-service movies error: {e}")
-
-    # REVIEWS
-    try:
-        r = requests.delete(f"{REVIEWS}/all", timeout=5)
-        if r.status_code == 200:
-            result["reviews_deleted"] = True
-        else:
-            result["errors"].append("DELETE /reviews/all failed")
-    except Exception as e:
-        result["errors"].append(f"movies-service reviews error: {e}")
-
-    # ----------------------
-    # 3) RATINGS-SERVICE
-    # ----------------------
-    try:
-        r = requests.delete(f"{RATINGS}/ratings/all", timeout=5)
-        if r.status_code == 200:
-            result["ratings_deleted"] = True
-        else:
-            result["errors"].append("DELETE /ratings/all failed")
-    except Exception as e:
-        result["errors"].append(f"ratings-service error: {e}")
-
-    return {"ok": True, "result": result}
\ No newline at end of file
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Session
+from .models import Base, S1Log
+from .db import engine, SessionLocal, warm_pool
+from common.health import Step, install_health
+from .seed import fake_user, fake_movie, fake_review, fake_rating
+from common.profiling import ProfilingRoute, install_profiling
+from .resilience import CircuitOpenError, LoadShedError
+from .clients import (
+    create_user, create_movie, create_review, create_rating,
+    get_user, get_movie, get_movie_ratings, list_users, delete_user, delete_all,
+    client_stats, merge_client_stats, close_clients, warm_clients
+)
+from common.workers import collect, publish
+import asyncio
+import httpx
+import os
+
+# Intervalo em que cada worker publica as estatísticas dos clientes S2
+STATS_PUBLISH_INTERVAL = float(os.getenv("WORKER_STATS_INTERVAL", "2"))
+
+api = FastAPI(title="s1-manager")
+api.router.route_class = ProfilingRoute
+install_profiling(api)
+
+def migrate():
+    Base.metadata.create_all(bind=engine)
+
+install_health(
+    api,
+    Step("postgres_pool", warm_pool),
+    Step("migrations", migrate, once=True),
+    # Não obrigatório: o s1-manager fica pronto mesmo com um S2 fora do ar
+    Step("s2_connections", warm_clients, required=False),
+)
+
+async def publish_client_stats():
+    while True:
+        publish("clients", client_stats())
+        await asyncio.sleep(STATS_PUBLISH_INTERVAL)
+
+@api.on_event("startup")
+async def startup():
+    api.state.stats_task = asyncio.create_task(publish_client_stats())
+
+@api.on_event("shutdown")
+async def shutdown():
+    api.state.stats_task.cancel()
+    await close_clients()
+
+@api.exception_handler(LoadShedError)
+async def load_shed_handler(request: Request, exc: LoadShedError):
+    # Rejeita rápido em vez de deixar a request esperar o timeout do S2 saturado
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc), "service": exc.service},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@api.exception_handler(CircuitOpenError)
+async def circuit_open_handler(request: Request, exc: CircuitOpenError):
+    # Breaker aberto numa consulta interativa: falha imediata
+    return JSONResponse(status_code=503, content={"detail": "circuit_open"})
+
+@api.exception_handler(httpx.HTTPError)
+async def s2_error_handler(request: Request, exc: httpx.HTTPError):
+    return JSONResponse(status_code=502, content={"detail": f"{type(exc).__name__}: {exc}"})
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+@api.post("/run")
+async def run_scenario(
+    users: int = Query(5, ge=0),
+    movies: int = Query(5, ge=0),
+    ratings: int = Query(10, ge=0),
+    reviews: int = Query(10, ge=0),
+    db: Session = Depends(get_db),
+):
+    """
+    Gera dados e chama S2:
+      - cria <users> usuários (users-service)
+      - cria <movies> filmes (movies-service /movies)
+      - cria <ratings> notas (ratings-service /ratings)
+      - cria <reviews> resenhas (movies-service /reviews)
+    Todas as requests/responses são logadas em s1_logs (Postgres).
+    As chamadas usam prioridade "bulk"; se algum S2 estiver saturado a
+    execução para e responde 503 com Retry-After e o que já foi criado.
+    """
+    user_ids, movie_ids = [], []
+    created = {"ratings": 0, "reviews": 0}
+
+    def summary(ok: bool, **extra) -> dict:
+        return {
+            "ok": ok,
+            "users_created": len(user_ids),
+            "movies_created": len(movie_ids),
+            "ratings_created": created["ratings"],
+            "reviews_created": created["reviews"],
+            **extra,
+        }
+
+    try:
+        # 1) Usuários
+        for _ in range(users):
+            resp = await create_user(db, fake_user())
+            if not resp or resp.status_code >= 400:
+                continue
+            try:
+                data = resp.json()
+                user_ids.append(data["id"])
+            except Exception:
+                continue
+
+        # 2) Filmes
+        for _ in range(movies):
+            resp = await create_movie(db, fake_movie())
+            if not resp or resp.status_code >= 400:
+                continue
+            try:
+                data = resp.json()
+                movie_ids.append(data["id"])
+            except Exception:
+                continue
+
+        if not user_ids or not movie_ids:
+            return summary(
+                False,
+                message="Nenhum usuário ou filme válido foi criado. "
+                        "Verifique se os S2 estão acessíveis e se os IDs retornados estão sendo extraídos corretamente."
+            )
+
+        total_users = len(user_ids)
+        total_movies = len(movie_ids)
+
+        # Ratings (Redis)
+        for i in range(ratings):
+            payload = fake_rating(user_ids[i % total_users], movie_ids[i % total_movies])
+            resp = await create_rating(db, payload)
+            if resp is not None and resp.status_code < 400:
+                created["ratings"] += 1
+
+        # Reviews (Mongo)
+        for i in range(reviews):
+            payload = fake_review(user_ids[i % total_users], movie_ids[i % total_movies])
+            resp = await create_review(db, payload)
+            if resp is not None and resp.status_code < 400:
+                created["reviews"] += 1
+    except LoadShedError as exc:
+        # Para no primeiro S2 saturado, mas devolve o que já foi criado
+        return JSONResponse(
+            status_code=503,
+            content=summary(False, detail=str(exc), service=exc.service),
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+
+    return summary(True)
+
+# Consultas interativas: repassadas aos S2 com prioridade "interactive"
+def s2_response(resp) -> JSONResponse:
+    try:
+        content = resp.json()
+    except ValueError:
+        content = {"detail": resp.text}
+    return JSONResponse(status_code=resp.status_code, content=content)
+
+@api.get("/users/{user_id}")
+async def user_lookup(user_id: str):
+    return s2_response(await get_user(user_id))
+
+@api.get("/movies/{movie_id}")
+async def movie_lookup(movie_id: str):
+    """
+    Filme (movies-service) com o resumo de ratings (ratings-service), as duas
+    chamadas em paralelo. Se só o ratings-service falhar, devolve o filme
+    com "ratings": null.
+    """
+    movie, ratings = await asyncio.gather(get_movie(movie_id), get_movie_ratings(movie_id), return_exceptions=True)
+    if isinstance(movie, BaseException):
+        raise movie
+    if movie.status_code != 200:
+        return s2_response(movie)
+    summary = None
+    if not isinstance(ratings, BaseException) and ratings.status_code == 200:
+        data = ratings.json()
+        summary = {"count": data["count"], "average": data["average"]}
+    return {**movie.json(), "ratings": summary}
+
+@api.get("/stats/clients")
+def clients_stats(per_worker: bool = False):
+    """
+    Estado dos circuit breakers, retries, hedges (e taxa de vitória do hedge)
+    e latências p50/p95 observadas por serviço S2, somados entre os workers
+    do container. per_worker=true devolve o snapshot de cada worker (por pid).
+    """
+    publish("clients", client_stats())
+    snapshots = collect("clients")
+    if per_worker:
+        return snapshots
+    return merge_client_stats(list(snapshots.values()))
+
+@api.get("/logs")
+def logs(limit: int = 50, db: Session = Depends(get_db)):
+    rows = db.query(S1Log).order_by(S1Log.id.desc()).limit(limit).all()
+    return [
+        {
+            "id": l.id, "ts": str(l.ts), "service": l.service,
+            "method": l.method, "url": l.url,
+            "status": l.response_status
+        } for l in rows
+    ]
+    
+# DELETA OS DADOS DE TODOS OS BANCOS
+@api.delete("/reset", status_code=200)
+async def reset_all():
+    """
+    Limpa TODOS os serviços usando chamadas HTTP, pelos mesmos clientes S2
+    do /run (retry, hedge e circuit breaker; prioridade "bulk").
+    """
+    result = {
+        "users_deleted": 0,
+        "movies_deleted": False,
+        "reviews_deleted": False,
+        "ratings_deleted": False,
+        "errors": []
+    }
+
+    # ----------------------
+    # 1) USERS-SERVICE
+    # ----------------------
+    try:
+        r = await list_users()
+        if r.status_code == 200:
+            users = r.json()
+            deleted = 0
+            for u in users:
+                uid = u.get("id")
+                if uid:
+                    dr = await delete_user(uid)
+                    if dr.status_code in (200, 204):
+                        deleted += 1
+            result["users_deleted"] = deleted
+        else:
+            result["errors"].append("GET /users failed")
+    except Exception as e:
+        result["errors"].append(f"users-service error: {e}")
+
+    # ----------------------
+    # 2) MOVIES-SERVICE
+    # ----------------------
+    try:
+        r = await delete_all("movies-service", "/movies/all")
+        if r.status_code == 200:
+            result["movies_deleted"] = True
+        else:
+            result["errors"].append("DELETE /movies/all failed")
+    except Exception as e:
+        result["errors"].append(f"movies-service movies error: {e}")
+
+    # REVIEWS
+    try:
+        r = await delete_all("movies-service", "/reviews/all")
+        if r.status_code == 200:
+            result["reviews_deleted"] = True
+        else:
+            result["errors"].append("DELETE /reviews/all failed")
+    except Exception as e:
+        result["errors"].append(f"movies-service reviews error: {e}")
+
+    # ----------------------
+    # 3) RATINGS-SERVICE
+    # ----------------------
+    try:
+        r = await delete_all("ratings-service", "/ratings/all")
+        if r.status_code == 200:
+            result["ratings_deleted"] = True
+        else:
+            result["errors"].append("DELETE /ratings/all failed")
+    except Exception as e:
+        result["errors"].append(f"ratings-service error: {e}")
+
+    return {"ok": True, "result": result}
@@ -0,0 +1,363 @@
+import asyncio, heapq, itertools, os, random, time
+from collections import deque
+import httpx
+from common.profiling import timed
+from common.workers import WORKERS
+
+# Métodos que podem ser repetidos/duplicados sem efeito colateral extra
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+def env_float(service: str, name: str, default: float) -> float:
+    # ex.: MOVIES_SERVICE_TIMEOUT=5
+    prefix = service.upper().replace("-", "_")
+    return float(os.getenv(f"{prefix}_{name}", os.getenv(f"S1_{name}", str(default))))
+
+
+# Menor valor = maior prioridade: leituras interativas passam à frente do seed
+PRIORITIES = {"interactive": 0, "bulk": 1}
+
+
+class ServicePolicy:
+    def __init__(self, service: str):
+        self.service = service
+        # Orçamento total da chamada, incluindo retries e hedge
+        self.timeout = env_float(service, "TIMEOUT", 10.0)
+        self.retries = int(env_float(service, "RETRIES", 2))
+        self.backoff_base = env_float(service, "BACKOFF_BASE", 0.1)
+        self.backoff_max = env_float(service, "BACKOFF_MAX", 2.0)
+        self.hedge = env_float(service, "HEDGE", 1) == 1
+        # Delay mínimo do hedge enquanto não há amostras de latência suficientes
+        self.hedge_min_delay = env_float(service, "HEDGE_MIN_DELAY", 0.05)
+        self.breaker_failures = int(env_float(service, "BREAKER_FAILURES", 5))
+        self.breaker_reset = env_float(service, "BREAKER_RESET", 15.0)
+        # Limites e filas são do container: cada worker fica com a sua parte
+        self.limit_initial = max(1, env_float(service, "LIMIT_INITIAL", 20) / WORKERS)
+        self.limit_min = max(1, env_float(service, "LIMIT_MIN", 2) / WORKERS)
+        self.limit_max = max(1, env_float(service, "LIMIT_MAX", 200) / WORKERS)
+        # Latência acima de tolerance x latência base conta como congestionamento
+        self.limit_tolerance = env_float(service, "LIMIT_TOLERANCE", 2.0)
+        self.limit_backoff = env_float(service, "LIMIT_BACKOFF", 0.9)
+        self.queue_interactive = max(1, int(env_float(service, "QUEUE_INTERACTIVE", 100) / WORKERS))
+        self.queue_bulk = max(1, int(env_float(service, "QUEUE_BULK", 20) / WORKERS))
+        self.max_connections = max(1, int(env_float(service, "MAX_CONNECTIONS", 100) / WORKERS))
+        self.queue_timeout = env_float(service, "QUEUE_TIMEOUT", 2.0)
+
+
+class LatencyTracker:
+    def __init__(self, size: int = 500):
+        self.samples = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, p: float) -> float | None:
+        if len(self.samples) < 20:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(int(len(ordered) * p), len(ordered) - 1)]
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class LoadShedError(Exception):
+    def __init__(self, service: str, retry_after: int):
+        super().__init__(f"{service} saturado, tente novamente em {retry_after}s")
+        self.service = service
+        self.retry_after = retry_after
+
+
+class AdaptiveLimiter:
+    """
+    Limite de concorrência AIMD: cresce ~1 por janela de requests enquanto a
+    latência fica perto da base (menor latência recente) e cai
+    multiplicativamente quando ela passa de `tolerance` x base ou há falha.
+    Quem não cabe no limite espera numa fila por prioridade; fila cheia ou
+    espera acima de `queue_timeout` rejeita na hora (LoadShedError).
+    """
+    def __init__(self, service: str, policy: ServicePolicy):
+        self.service = service
+        self.policy = policy
+        self.limit = policy.limit_initial
+        self.in_flight = 0
+        self.baseline = deque(maxlen=200)
+        self.waiters = []  # heap (prioridade, seq, future)
+        self.queued = {p: 0 for p in PRIORITIES.values()}
+        self.max_queue = {
+            PRIORITIES["interactive"]: policy.queue_interactive,
+            PRIORITIES["bulk"]: policy.queue_bulk,
+        }
+        self.seq = itertools.count()
+        self.shed = 0
+        self.last_decrease = 0.0
+
+    def retry_after(self) -> int:
+        return max(1, int(self.policy.queue_timeout))
+
+    async def acquire(self, priority: str = "interactive"):
+        prio = PRIORITIES[priority]
+        if self.in_flight < int(self.limit) and not self.waiters:
+            self.in_flight += 1
+            return
+
+        if self.queued[prio] >= self.max_queue[prio]:
+            self.shed += 1
+            raise LoadShedError(self.service, self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (prio, next(self.seq), future)
+        heapq.heappush(self.waiters, entry)
+        self.queued[prio] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.policy.queue_timeout)
+        except BaseException as e:
+            if future.done():
+                # vaga concedida no mesmo instante do timeout/cancelamento: devolve
+                self.release_slot()
+            else:
+                future.cancel()
+                self.waiters.remove(entry)
+                heapq.heapify(self.waiters)
+            if isinstance(e, asyncio.TimeoutError):
+                self.shed += 1
+                raise LoadShedError(self.service, self.retry_after()) from None
+            raise
+        finally:
+            self.queued[prio] -= 1
+
+    def release(self, latency: float, ok: bool):
+        self.update_limit(latency, ok)
+        self.release_slot()
+
+    def release_slot(self):
+        self.in_flight -= 1
+        # Acorda os próximos da fila, por prioridade, enquanto houver vaga
+        while self.waiters and self.in_flight < int(self.limit):
+            _, _, future = heapq.heappop(self.waiters)
+            self.in_flight += 1
+            future.set_result(None)
+
+    def update_limit(self, latency: float, ok: bool):
+        if ok:
+            self.baseline.append(latency)
+        base = min(self.baseline) if self.baseline else latency
+
+        congested = not ok or latency > base * self.policy.limit_tolerance
+        now = time.monotonic()
+        if congested:
+            # No máximo uma redução por janela de latência base, para não
+            # derrubar o limite várias vezes pelo mesmo pico
+            if now - self.last_decrease > base:
+                self.limit = max(self.policy.limit_min, self.limit * self.policy.limit_backoff)
+                self.last_decrease = now
+        elif self.in_flight >= int(self.limit) - 1:
+            # Só cresce quando o limite está de fato sendo usado
+            self.limit = min(self.policy.limit_max, self.limit + 1 / self.limit)
+
+    def stats(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queued": {name: self.queued[p] for name, p in PRIORITIES.items()},
+            "shed": self.shed,
+            "baseline_ms": round(min(self.baseline) * 1000, 1) if self.baseline else None,
+        }
+
+
+class CircuitBreaker:
+    """
+    closed -> open após N falhas seguidas; open -> half_open depois de
+    `reset_after` segundos, deixando passar uma única chamada de teste.
+    """
+    def __init__(self, failures: int, reset_after: float):
+        self.max_failures = failures
+        self.reset_after = reset_after
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+
+    def before_call(self) -> bool:
+        """Libera ou recusa a chamada; True quando ela é a chamada de teste do half_open."""
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_after:
+                raise CircuitOpenError()
+            self.state = "half_open"
+            self.trial_in_flight = False
+        if self.state == "half_open":
+            if self.trial_in_flight:
+                raise CircuitOpenError()
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def release_trial(self):
+        # Chamada de teste que terminou sem record() (cancelada): sem isso o
+        # breaker ficaria em half_open recusando tudo para sempre
+        if self.state == "half_open":
+            self.trial_in_flight = False
+
+    def record(self, ok: bool):
+        if ok:
+            self.state = "closed"
+            self.failures = 0
+            self.trial_in_flight = False
+            return
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.max_failures:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+        }
+
+
+class ServiceClient:
+    """
+    Cliente HTTP de um serviço S2: conexão reaproveitada, limite adaptativo
+    de concorrência com fila por prioridade, timeout total por chamada,
+    retries com backoff exponencial e jitter para métodos idempotentes,
+    hedge após o p95 observado e circuit breaker.
+    """
+    def __init__(self, service: str):
+        self.service = service
+        self.policy = ServicePolicy(service)
+        self.latency = LatencyTracker()
+        self.breaker = CircuitBreaker(self.policy.breaker_failures, self.policy.breaker_reset)
+        self.limiter = AdaptiveLimiter(service, self.policy)
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.policy.timeout),
+            limits=httpx.Limits(
+                max_connections=self.policy.max_connections,
+                max_keepalive_connections=self.policy.max_connections,
+            ),
+        )
+        self.counters = {
+            "calls": 0, "failures": 0, "retries": 0,
+            "hedges": 0, "hedge_wins": 0, "circuit_rejected": 0,
+        }
+
+    async def send(self, method: str, url: str, json_body: dict | None) -> httpx.Response:
+        started = time.perf_counter()
+        with timed("http"):
+            resp = await self.client.request(method, url, json=json_body)
+        if resp.status_code < 500:
+            self.latency.add(time.perf_counter() - started)
+        return resp
+
+    def hedge_delay(self) -> float:
+        p95 = self.latency.percentile(0.95)
+        return max(p95 if p95 is not None else self.policy.timeout / 2, self.policy.hedge_min_delay)
+
+    async def send_hedged(self, method: str, url: str, json_body: dict | None) -> httpx.Response:
+        primary = asyncio.ensure_future(self.send(method, url, json_body))
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=self.hedge_delay())
+            if done:
+                return primary.result()
+
+            # Primeira tentativa passou do p95: dispara uma segunda em paralelo
+            self.counters["hedges"] += 1
+            hedge = asyncio.ensure_future(self.send(method, url, json_body))
+            pending = {primary, hedge}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    if task is hedge:
+                        self.counters["hedge_wins"] += 1
+                    return task.result()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def request(self, method: str, url: str, json_body: dict | None,
+                      priority: str = "interactive", idempotent: bool | None = None) -> httpx.Response:
+        """
+        `idempotent` sobrescreve a regra por método, ex.: um POST que é upsert
+        pode ser repetido e receber hedge como um PUT.
+        """
+        await self.limiter.acquire(priority)
+        try:
+            trial = self.breaker.before_call()
+        except CircuitOpenError:
+            self.counters["circuit_rejected"] += 1
+            self.limiter.release_slot()
+            raise
+
+        started = time.perf_counter()
+        ok = False
+        try:
+            if idempotent is None:
+                idempotent = method.upper() in IDEMPOTENT_METHODS
+            resp = await self.attempt(method, url, json_body, idempotent)
+            ok = resp.status_code < 500
+            return resp
+        finally:
+            if trial:
+                self.breaker.release_trial()
+            self.limiter.release(time.perf_counter() - started, ok)
+
+    async def attempt(self, method: str, url: str, json_body: dict | None, idempotent: bool) -> httpx.Response:
+        self.counters["calls"] += 1
+        deadline = time.monotonic() + self.policy.timeout
+        attempt = 0
+
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                if idempotent and self.policy.hedge:
+                    call = self.send_hedged(method, url, json_body)
+                else:
+                    call = self.send(method, url, json_body)
+                resp = await asyncio.wait_for(call, timeout=remaining)
+                if resp.status_code < 500:
+                    self.breaker.record(True)
+                    return resp
+                error = None
+            except Exception as e:
+                # Erros de transporte, timeout do orçamento ou falhas inesperadas
+                resp, error = None, e
+
+            # POST só é repetido quando a conexão nem chegou a ser aberta
+            retryable = idempotent or isinstance(error, httpx.ConnectError)
+            backoff = min(self.policy.backoff_max, self.policy.backoff_base * 2 ** attempt)
+            backoff = random.uniform(0, backoff)  # full jitter
+
+            if not retryable or attempt >= self.policy.retries or time.monotonic() + backoff >= deadline:
+                self.counters["failures"] += 1
+                self.breaker.record(False)
+                if resp is not None:
+                    return resp
+                raise error
+
+            attempt += 1
+            self.counters["retries"] += 1
+            await asyncio.sleep(backoff)
+
+    def stats(self) -> dict:
+        p50 = self.latency.percentile(0.5)
+        p95 = self.latency.percentile(0.95)
+        hedges = self.counters["hedges"]
+        return {
+            **self.counters,
+            "hedge_win_rate": (self.counters["hedge_wins"] / hedges) if hedges else 0.0,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "breaker": self.breaker.stats(),
+            "limiter": self.limiter.stats(),
+        }
+
+    async def aclose(self):
+        await self.client.aclose()
@@ -1,16 +1,52 @@
-import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
-
-PGUSER = os.getenv("PGUSER", "postgres")
-PGPASSWORD = os.getenv("PGPASSWORD", "postgres")
-PGHOST = os.getenv("PGHOST", "postgres")
-PGPORT = os.getenv("PGPORT", "5432")
-PGDATABASE = os.getenv("PGDATABASE", "polyglot")
-
-DATABASE_URL = f"postgresql+psycopg://{PGUSER}:{PGPASSWORD}@{PGHOST}:{PGPORT}/{PGDATABASE}"
-
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
-SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
-
+import os, time
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker, declarative_base
+from common.profiling import PROFILING_ENABLED, add_time
+from common.workers import per_worker
+
+PGUSER = os.getenv("PGUSER", "postgres")
+PGPASSWORD = os.getenv("PGPASSWORD", "postgres")
+PGHOST = os.getenv("PGHOST", "postgres")
+PGPORT = os.getenv("PGPORT", "5432")
+PGDATABASE = os.getenv("PGDATABASE", "polyglot")
+
+DATABASE_URL = f"postgresql+psycopg://{PGUSER}:{PGPASSWORD}@{PGHOST}:{PGPORT}/{PGDATABASE}"
+
+# Totais do container, divididos entre os workers (ver workers.py)
+PG_POOL_SIZE = per_worker(int(os.getenv("PG_POOL_SIZE", "10")))
+PG_MAX_OVERFLOW = per_worker(int(os.getenv("PG_MAX_OVERFLOW", "10")), minimum=0)
+
+engine = create_engine(DATABASE_URL, pool_pre_ping=True, pool_size=PG_POOL_SIZE, max_overflow=PG_MAX_OVERFLOW)
+# Com GUNICORN_PRELOAD o engine é criado no master: o worker não reaproveita
+# conexões abertas antes do fork
+os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+if PROFILING_ENABLED:
+    # Soma o tempo de cada query no perfil da request (só com profiling ligado)
+    # O início fica no contexto de execução de cada query: uma query que falha
+    # não deixa nada para trás na conexão, e handle_error conta o tempo dela
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._query_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None and hasattr(context, "_query_start"):
+            add_time("db", time.perf_counter() - context._query_start)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        context = exception_context.execution_context
+        if context is not None and hasattr(context, "_query_start"):
+            add_time("db", time.perf_counter() - context._query_start)
+
+def warm_pool():
+    # Abre todas as conexões do pool de uma vez, em vez de na primeira rajada de requests
+    conns = [engine.connect() for _ in range(engine.pool.size())]
+    for conn in conns:
+        conn.execute(text("SELECT 1"))
+        conn.close()
+
+SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+
 Base = declarative_base()
\ No newline at end of file
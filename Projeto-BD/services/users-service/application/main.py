@@ -1,68 +1,111 @@
-from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.orm import Session
-from .db import Base, engine, SessionLocal
-from .models import User
-from .schemas import UserCreate, UserOut, UserUpdate
-
-api = FastAPI(title="users-service")
-
-@api.on_event("startup")
-def startup():
-    Base.metadata.create_all(bind=engine)
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-@api.post("/users", response_model=UserOut, status_code=201)
-def create_user(payload: UserCreate, db: Session = Depends(get_db)):
-    if db.query(User).filter(User.email == payload.email).first():
-        raise HTTPException(status_code=409, detail="email already exists")
-    user = User(name=payload.name, email=payload.email)
-    db.add(user); db.commit(); db.refresh(user)
-    return user
-
-@api.get("/users/{user_id}", response_model=UserOut)
-def get_user(user_id: str, db: Session = Depends(get_db)):
-    user = db.get(User, user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="not found")
-    return user
-
-@api.get("/users", response_model=list[UserOut])
-def list_users(db: Session = Depends(get_db), limit: int = 20, offset: int = 0):
-    items = db.query(User).order_by(User.created_at.desc()).limit(limit).offset(offset).all()
-    return items
-
-@api.delete("/users/{user_id}", status_code=204)
-def delete_user(user_id: str, db: Session = Depends(get_db)):
-    user = db.get(User, user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="not found")
-    db.delete(user); db.commit()
-
-@api.put("/users/{user_id}", response_model=UserOut)
-def update_user(user_id: str, payload: UserUpdate, db: Session = Depends(get_db)):
-    user = db.get(User, user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="not found")
-
-    # Verifica duplicidade
-    if payload.email and payload.email != user.email:
-        if db.query(User).filter(User.email == payload.email).first():
-            raise HTTPException(status_code=409, detail="email already exists")
-
-    # Atualiza apenas campos enviados
-    if payload.name is not None:
-        user.name = payload.name
-
-    if payload.email is not None:
-        user.email = payload.email
-
-    db.commit()
-    db.refresh(user)
-
+from fastapi import FastAPI, Depends, HTTPException, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+import os
+from .db import Base, engine, SessionLocal, warm_pool
+from common.conditional import make_etag, etag_matches, not_modified
+from common.health import Step, install_health
+from common.profiling import ProfilingRoute, install_profiling
+from .models import User
+from .schemas import UserCreate, UserOut, UserUpdate
+
+api = FastAPI(title="users-service")
+api.router.route_class = ProfilingRoute
+# Comprime respostas (listas grandes) acima do limite em bytes
+api.add_middleware(GZipMiddleware, minimum_size=int(os.getenv("GZIP_MIN_SIZE", "1024")))
+install_profiling(api)
+
+# create_all não altera tabelas existentes: adiciona as colunas novas
+MIGRATIONS = [
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT now()",
+]
+
+def migrate(progress):
+    progress(0, len(MIGRATIONS) + 1)
+    Base.metadata.create_all(bind=engine)
+    for i, statement in enumerate(MIGRATIONS, start=1):
+        progress(i, len(MIGRATIONS) + 1)
+        with engine.begin() as conn:
+            conn.execute(text(statement))
+    progress(len(MIGRATIONS) + 1)
+
+def warm_cache():
+    # Primeira página da listagem (planos de query e páginas no cache do Postgres)
+    with SessionLocal() as db:
+        db.query(User).order_by(User.created_at.desc()).limit(20).all()
+
+install_health(
+    api,
+    Step("postgres_pool", warm_pool),
+    Step("migrations", migrate, once=True),
+    Step("cache", warm_cache, required=False),
+)
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+@api.post("/users", response_model=UserOut, status_code=201)
+def create_user(payload: UserCreate, db: Session = Depends(get_db)):
+    if db.query(User).filter(User.email == payload.email).first():
+        raise HTTPException(status_code=409, detail="email already exists")
+    user = User(name=payload.name, email=payload.email)
+    db.add(user); db.commit(); db.refresh(user)
+    return user
+
+def user_etag(user: User) -> str:
+    return make_etag("user", user.id, user.version)
+
+@api.get("/users/{user_id}", response_model=UserOut)
+def get_user(user_id: str, request: Request, response: Response, db: Session = Depends(get_db)):
+    user = db.get(User, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="not found")
+
+    etag = user_etag(user)
+    if etag_matches(request, etag):
+        # 304 direto, sem passar pelo response_model
+        return not_modified(etag)
+
+    response.headers["ETag"] = etag
+    return user
+
+@api.get("/users", response_model=list[UserOut])
+def list_users(db: Session = Depends(get_db), limit: int = 20, offset: int = 0):
+    items = db.query(User).order_by(User.created_at.desc()).limit(limit).offset(offset).all()
+    return items
+
+@api.delete("/users/{user_id}", status_code=204)
+def delete_user(user_id: str, db: Session = Depends(get_db)):
+    user = db.get(User, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="not found")
+    db.delete(user); db.commit()
+
+@api.put("/users/{user_id}", response_model=UserOut)
+def update_user(user_id: str, payload: UserUpdate, db: Session = Depends(get_db)):
+    user = db.get(User, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="not found")
+
+    # Verifica duplicidade
+    if payload.email and payload.email != user.email:
+        if db.query(User).filter(User.email == payload.email).first():
+            raise HTTPException(status_code=409, detail="email already exists")
+
+    # Atualiza apenas campos enviados
+    if payload.name is not None:
+        user.name = payload.name
+
+    if payload.email is not None:
+        user.email = payload.email
+
+    db.commit()
+    db.refresh(user)
+
     return user
\ No newline at end of file